@@ -0,0 +1,135 @@
+import glob
+import json
+import os
+
+
+def write_yolo_labels(labels_path, image_index, label_lines):
+    """
+    Writes all yolo label lines of one image at once. File is written
+    to a temporary file first and then renamed, so a crash never
+    leaves a partially written label file behind.
+    """
+    filepath = os.path.join(labels_path, str(image_index) + ".txt")
+    with open(filepath + ".tmp", "w", encoding="utf-8") as f:
+        f.writelines(label_lines)
+    os.replace(filepath + ".tmp", filepath)
+
+
+def create_coco_sink(parts_path, images_per_part, next_annotation_id=1,
+                     part_index=0, images_in_part=0):
+    """
+    Returns the coco sink that streams image and annotation records to
+    JSONL part files instead of keeping them in memory. Annotation ids
+    start from next_annotation_id, which is 1 by default because
+    pycocotools treats annotation id 0 as unmatched. Part index and
+    images in part are given when a previous run is continued.
+    """
+    if not os.path.exists(parts_path):
+        os.makedirs(parts_path)
+    return {
+        "parts_path": parts_path,
+        "images_per_part": images_per_part,
+        "next_annotation_id": next_annotation_id,
+        "part_index": part_index,
+        "images_in_part": images_in_part,
+        "records": []
+    }
+
+
+def add_coco_image(coco_sink, image):
+    """
+    Adds the image record to the sink. Records of the previous image
+    are flushed to disk first.
+    """
+    flush_coco_sink(coco_sink)
+    if coco_sink["images_in_part"] == coco_sink["images_per_part"]:
+        coco_sink["part_index"] += 1
+        coco_sink["images_in_part"] = 0
+    coco_sink["images_in_part"] += 1
+    coco_sink["records"].append({"type": "image", "record": image})
+
+
+def add_coco_annotation(coco_sink, annotation):
+    """
+    Adds the annotation record to the sink.
+    """
+    coco_sink["records"].append({"type": "annotation", "record": annotation})
+
+
+def get_next_annotation_id(coco_sink):
+    """
+    Returns a new unique annotation id. Ids are monotonic
+    across the whole dataset.
+    """
+    annotation_id = coco_sink["next_annotation_id"]
+    coco_sink["next_annotation_id"] += 1
+    return annotation_id
+
+
+def flush_coco_sink(coco_sink):
+    """
+    Appends the buffered records to the current part file.
+    """
+    if len(coco_sink["records"]) == 0:
+        return
+    part_filepath = os.path.join(
+        coco_sink["parts_path"],
+        "part_" + str(coco_sink["part_index"]) + ".jsonl")
+    with open(part_filepath, "a", encoding="utf-8") as f:
+        for record in coco_sink["records"]:
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    coco_sink["records"] = []
+
+
+def truncate_coco_parts(parts_path, part_index, part_size):
+    """
+    Removes coco records written after the given position, which are
+    left by work that was not finished before a crash. Truncating to
+    part 0 of size 0 removes all records.
+    """
+    for part_filepath in glob.glob(os.path.join(parts_path, "part_*.jsonl")):
+        index = int(os.path.basename(part_filepath)[5:-6])
+        if index > part_index or (index == part_index and part_size == 0):
+            os.remove(part_filepath)
+        elif index == part_index:
+            with open(part_filepath, "r+b") as f:
+                f.truncate(part_size)
+
+
+def read_coco_parts(parts_path, record_type):
+    """
+    Yields the records of the given type ("image" or "annotation") from
+    all part files in order. A partially written last line left by
+    a crash is skipped.
+    """
+    part_filepaths = sorted(
+        glob.glob(os.path.join(parts_path, "part_*.jsonl")),
+        key=lambda path: int(os.path.basename(path)[5:-6]))
+    for part_filepath in part_filepaths:
+        with open(part_filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record["type"] == record_type:
+                    yield record["record"]
+
+
+def merge_coco_parts(parts_path, label_filepath, coco_header):
+    """
+    Merges all part files into one coco json file. Header contains
+    the description, licenses and categories. Records are streamed
+    so the whole dataset is never loaded into memory.
+    """
+    with open(label_filepath + ".tmp", "w", encoding="utf-8") as f:
+        f.write(json.dumps(coco_header)[:-1])
+        for key in ("images", "annotations"):
+            f.write(", \"" + key + "\": [")
+            for i, record in enumerate(read_coco_parts(parts_path, key[:-1])):
+                f.write((", " if i > 0 else "") + json.dumps(record))
+            f.write("]")
+        f.write("}")
+    os.replace(label_filepath + ".tmp", label_filepath)
@@ -1,22 +1,21 @@
 import bpy
 from mathutils import Vector
+import numpy as np
 
 
-def create_coco(data, image_id, category_id, bbox):
+def create_coco(annotation_id, image_id, category_id, bbox):
     """
-    Adds the coco annotation for the given bounding box to
-    the given coco data dictionary.
+    Returns the coco annotation for the given bounding box.
     """
-    data["annotations"].append({
-        "id": image_id,
+    return {
+        "id": annotation_id,
         "image_id": image_id,
         "category_id": category_id,
         "bbox": [bbox[0], bbox[1], bbox[2], bbox[3]],
         "area": bbox[2] * bbox[3],
         "iscrowd": 0,
         "segmentation": []
-    })
-    return data
+    }
 
 
 def get_co_in_pixels(scene, co_2d):
@@ -83,6 +82,31 @@ def get_all_tractors_bounding_boxes():
     return tractors_bounding_boxes
 
 
+def get_boxes_array(vehicle_boxes):
+    """
+    Stacks the bounding boxes returned by get_all_cars_bounding_boxes
+    or get_all_tractors_bounding_boxes into an (N, 4, 3) array.
+    """
+    return np.array(
+        [[point[:] for point in box] for box in vehicle_boxes],
+        dtype=float).reshape(-1, 4, 3)
+
+
+def get_camera_matrix(scene, cam_obj):
+    """
+    Returns the 4x4 matrix (projection @ view) that transforms world
+    coordinates of the given camera to clip space.
+    """
+    # Evaluating the depsgraph also updates the camera world matrix
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    render_size = get_render_scale(scene)
+    projection_matrix = cam_obj.calc_matrix_camera(
+        depsgraph, x=render_size[0], y=render_size[1],
+        scale_x=scene.render.pixel_aspect_x,
+        scale_y=scene.render.pixel_aspect_y)
+    return np.array(projection_matrix @ cam_obj.matrix_world.inverted())
+
+
 def return_coco_box(box_x, box_y, scene):
     """
     Returns the bounding box from the given lists of
@@ -112,3 +136,33 @@ def return_yolo_box(box_x, box_y):
     height = max(box_y) - min(box_y)
 
     return x, y, width, height
+
+
+def return_coco_boxes(boxes, scene, render_size=None):
+    """
+    Vectorized return_coco_box. Takes (N, 4) camera frame boxes
+    (min_x, min_y, max_x, max_y) and returns (N, 4) pixel boxes of
+    an image with the given size, the scene resolution by default.
+    """
+    if render_size is None:
+        render_size = get_render_scale(scene)
+    render_size = np.array(render_size)
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    top_left = np.round(boxes[:, [0, 3]] * render_size).astype(int)
+    size = np.round((boxes[:, 2:] - boxes[:, :2]) * render_size).astype(int)
+    return np.stack((
+        top_left[:, 0], render_size[1] - top_left[:, 1],
+        size[:, 0], size[:, 1]), axis=-1)
+
+
+def return_yolo_boxes(boxes):
+    """
+    Vectorized return_yolo_box. Takes (N, 4) camera frame boxes
+    (min_x, min_y, max_x, max_y) and returns (N, 4) yolo boxes.
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    return np.stack((
+        (boxes[:, 0] + boxes[:, 2]) / 2,
+        1 - (boxes[:, 1] + boxes[:, 3]) / 2,
+        boxes[:, 2] - boxes[:, 0],
+        boxes[:, 3] - boxes[:, 1]), axis=-1)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import re
+
+
+# Hashes of the files checked in this run, keyed by path, mtime and size
+file_hashes = {}
+
+
+def get_asset_files(folder_path, extension):
+    """
+    Returns the names of all the asset files with the given extension
+    in the folder, in natural order (Car2 before Car10). Names do not
+    have to be contiguous.
+    """
+    if not os.path.isdir(folder_path):
+        return []
+    return sorted(
+        [f for f in os.listdir(folder_path)
+         if f.endswith(extension) and
+         os.path.isfile(os.path.join(folder_path, f))],
+        key=lambda f: [int(part) if part.isdigit() else part
+                       for part in re.split(r"(\d+)", f)])
+
+
+def get_file_hash(filepath):
+    """
+    Returns the sha1 hash of the file.
+    """
+    file_hash = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_file_stamp(filepath, use_hash=False):
+    """
+    Returns the values that tell if the file changed since it was indexed.
+    """
+    stamp = {
+        "mtime": os.path.getmtime(filepath),
+        "size": os.path.getsize(filepath)
+    }
+    if use_hash:
+        stamp["sha1"] = get_file_hash(filepath)
+    return stamp
+
+
+def get_cached_file_hash(filepath):
+    """
+    Returns the sha1 hash of the file. The file is hashed only once per
+    run unless its mtime or size changes.
+    """
+    key = (filepath, os.path.getmtime(filepath), os.path.getsize(filepath))
+    if key not in file_hashes:
+        file_hashes[key] = get_file_hash(filepath)
+    return file_hashes[key]
+
+
+def is_entry_valid(entry, filepath):
+    """
+    Returns True if the manifest entry still describes the file. Entries
+    indexed with a hash are compared by hash, others by mtime and size.
+    """
+    if entry is None or not os.path.isfile(filepath):
+        return False
+    if "sha1" in entry:
+        return entry["sha1"] == get_cached_file_hash(filepath)
+    return (entry["mtime"] == os.path.getmtime(filepath) and
+            entry["size"] == os.path.getsize(filepath))
+
+
+def load_asset_manifest(manifest_filepath):
+    """
+    Returns the asset manifest or an empty one if it does not exist.
+    """
+    if not os.path.exists(manifest_filepath):
+        return {"vehicles": {}, "lands": {}}
+    with open(manifest_filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_asset_manifest(manifest, manifest_filepath):
+    """
+    Saves the asset manifest atomically.
+    """
+    with open(manifest_filepath + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_filepath + ".tmp", manifest_filepath)
+
+
+def get_valid_entry(manifest, section, main_path, relative_path):
+    """
+    Returns the manifest entry of the asset from the given section
+    ("vehicles" or "lands") if it is still valid, otherwise None.
+    """
+    entry = manifest[section].get(relative_path)
+    if is_entry_valid(entry, os.path.join(main_path, relative_path)):
+        return entry
+    return None
@@ -0,0 +1,134 @@
+import argparse
+import os
+import sys
+import time
+
+import bpy
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from asset_manifest import get_asset_files
+from vehicle_cache import (
+    get_library_object_name, import_fbx_vehicle, load_library_vehicle,
+    set_vehicle_library)
+
+
+VEHICLE_FOLDERS = ["Cars", "Tractors"]
+
+
+def get_vehicle_filepaths(main_path):
+    """
+    Returns the filepaths of all the fbx vehicle models.
+    """
+    return [os.path.join(main_path, "Vehicles", folder, filename)
+            for folder in VEHICLE_FOLDERS
+            for filename in get_asset_files(
+                os.path.join(main_path, "Vehicles", folder), ".fbx")]
+
+
+def prepare_vehicle_materials(vehicle_obj, object_name):
+    """
+    Makes sure the first material slot of the vehicle has a node material
+    with the Principled BSDF as its first node, as edit_material expects,
+    and gives the materials names that are unique in the library. Nodes
+    of a first material without it are replaced by a Principled BSDF
+    with the base color of the old one.
+    """
+    if len(vehicle_obj.material_slots) == 0:
+        vehicle_obj.data.materials.append(None)
+    if vehicle_obj.material_slots[0].material is None:
+        print("Adding a material to recolor to " + object_name)
+        vehicle_obj.material_slots[0].material = bpy.data.materials.new(
+            object_name + ":0")
+
+    for slot_index, slot in enumerate(vehicle_obj.material_slots):
+        if slot.material is None:
+            continue
+        slot.material.name = object_name + ":" + str(slot_index)
+        slot.material.use_nodes = True
+
+    node_tree = vehicle_obj.material_slots[0].material.node_tree
+    if len(node_tree.nodes) > 0 and \
+        node_tree.nodes[0].type == "BSDF_PRINCIPLED":
+        return
+    print("Replacing the material nodes of " + object_name +
+          " with a Principled BSDF")
+    base_color = (0.8, 0.8, 0.8, 1.0)
+    for node in node_tree.nodes:
+        if node.type == "BSDF_PRINCIPLED":
+            base_color = tuple(node.inputs[0].default_value)
+            break
+    node_tree.nodes.clear()
+    bsdf_node = node_tree.nodes.new(type="ShaderNodeBsdfPrincipled")
+    bsdf_node.inputs[0].default_value = base_color
+    output_node = node_tree.nodes.new(type="ShaderNodeOutputMaterial")
+    node_tree.links.new(bsdf_node.outputs[0], output_node.inputs[0])
+
+
+def bake_vehicle_library(main_path, library_filepath):
+    """
+    Imports all the fbx vehicle models once and writes them into one
+    blend library. Every object is named after its model file, for
+    example "Template:Cars/Car1.fbx", and keeps the name it had in the
+    fbx file as its "original_name" property.
+    """
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    vehicle_objects = set()
+    for model_filepath in get_vehicle_filepaths(main_path):
+        print("Baking " + model_filepath)
+        vehicle_obj, original_name = import_fbx_vehicle(model_filepath)
+        # Rename right away so the next import keeps its original name
+        vehicle_obj.name = get_library_object_name(model_filepath)
+        vehicle_obj["original_name"] = original_name
+        prepare_vehicle_materials(vehicle_obj, vehicle_obj.name)
+        vehicle_objects.add(vehicle_obj)
+
+    bpy.data.libraries.write(
+        library_filepath, vehicle_objects, fake_user=True, compress=False)
+    print("Baked " + str(len(vehicle_objects)) + " vehicles into " +
+          library_filepath)
+
+
+def benchmark_vehicle_loading(main_path, library_filepath, link=False):
+    """
+    Prints the load time of every vehicle model imported from the fbx
+    file and loaded from the baked library, each in an empty file.
+    """
+    fbx_times = []
+    library_times = []
+    for model_filepath in get_vehicle_filepaths(main_path):
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+        start_time = time.perf_counter()
+        import_fbx_vehicle(model_filepath)
+        fbx_times.append(time.perf_counter() - start_time)
+
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+        set_vehicle_library(library_filepath, link)
+        start_time = time.perf_counter()
+        load_library_vehicle(model_filepath)
+        library_times.append(time.perf_counter() - start_time)
+
+    print("Load time per vehicle [ms]".ljust(32) + "mean".rjust(10) +
+          "p50".rjust(10) + "max".rjust(10))
+    for name, times in (("fbx", fbx_times), ("library", library_times)):
+        times = np.array(times) * 1000
+        print(name.ljust(32) + str(round(float(np.mean(times)), 1)).rjust(10) +
+              str(round(float(np.median(times)), 1)).rjust(10) +
+              str(round(float(np.max(times)), 1)).rjust(10))
+    print("Speedup: " +
+          str(round(float(np.sum(fbx_times) / np.sum(library_times)), 1)) + "x")
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--main_path', dest='main_path', required=True)
+    parser.add_argument('--benchmark', dest='benchmark', action='store_true')
+    parser.add_argument('--link', dest='link', action='store_true')
+    args = parser.parse_args(argv)
+
+    library_filepath = os.path.join(
+        args.main_path, "Vehicles", "vehicles.blend")
+    bake_vehicle_library(args.main_path, library_filepath)
+    if args.benchmark:
+        benchmark_vehicle_loading(args.main_path, library_filepath, args.link)
@@ -0,0 +1,373 @@
+import math
+import sys
+import types
+
+import numpy as np
+
+
+class Vector:
+    """
+    Vector of floats with the x, y, z and xy accessors.
+    """
+    def __init__(self, values):
+        self.values = [float(value) for value in values]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self.values[index])
+        return self.values[index]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __sub__(self, other):
+        return Vector([a - b for a, b in zip(self.values, other)])
+
+    def __add__(self, other):
+        return Vector([a + b for a, b in zip(self.values, other)])
+
+    @property
+    def x(self):
+        return self.values[0]
+
+    @property
+    def y(self):
+        return self.values[1]
+
+    @property
+    def z(self):
+        return self.values[2]
+
+    @property
+    def xy(self):
+        return Vector(self.values[:2])
+
+
+class Matrix:
+    """
+    4x4 transformation matrix backed by a numpy array.
+    """
+    def __init__(self, rows=None):
+        self.array = np.identity(4) if rows is None else np.array(rows, dtype=float)
+
+    @staticmethod
+    def LocRotScale(location, rotation, scale):
+        rx, ry, rz = rotation
+        rotation_x = np.array([[1, 0, 0], [0, math.cos(rx), -math.sin(rx)],
+                               [0, math.sin(rx), math.cos(rx)]])
+        rotation_y = np.array([[math.cos(ry), 0, math.sin(ry)], [0, 1, 0],
+                               [-math.sin(ry), 0, math.cos(ry)]])
+        rotation_z = np.array([[math.cos(rz), -math.sin(rz), 0],
+                               [math.sin(rz), math.cos(rz), 0], [0, 0, 1]])
+        matrix = Matrix()
+        matrix.array[:3, :3] = (rotation_z @ rotation_y @ rotation_x) * \
+            np.array(list(scale))
+        matrix.array[:3, 3] = list(location)
+        return matrix
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self.array @ other.array)
+        point = self.array @ np.append(np.array(list(other), dtype=float), 1)
+        return Vector(point[:3] / point[3])
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(self.array))
+
+
+class BVHTree:
+    """
+    Overlap test of two boxes built by the legacy do_objects_overlap and
+    ray casts against triangles. Boxes are compared by their bottom faces
+    and their height intervals. Triangles are binned into a uniform grid
+    of their xy bounds, so a ray only tests the triangles of the cells
+    it crosses between the lowest and highest triangle.
+    """
+    cell_size = 5.0
+
+    def __init__(self, vertices, polygons=()):
+        self.vertices = np.array([list(vertex) for vertex in vertices])
+        self.triangles = np.empty((0, 3, 3))
+        self.cells = {}
+        if len(polygons) == 0:
+            return
+        self.triangles = self.vertices[np.array(polygons)]
+        self.z_range = (self.triangles[..., 2].min(), self.triangles[..., 2].max())
+        min_cells = np.floor(self.triangles[..., :2].min(axis=1) / self.cell_size)
+        max_cells = np.floor(self.triangles[..., :2].max(axis=1) / self.cell_size)
+        for k, (min_cell, max_cell) in enumerate(zip(
+            min_cells.astype(int).tolist(), max_cells.astype(int).tolist())):
+            for i in range(min_cell[0], max_cell[0] + 1):
+                for j in range(min_cell[1], max_cell[1] + 1):
+                    self.cells.setdefault((i, j), []).append(k)
+
+    @staticmethod
+    def FromPolygons(vertices, polygons):
+        return BVHTree(vertices, polygons)
+
+    def get_ray_triangles(self, origin, direction):
+        """
+        Returns the indices of the triangles in the cells crossed by the
+        ray between the lowest and the highest triangle.
+        """
+        if abs(direction[2]) < 1e-9:
+            return np.arange(len(self.triangles))
+        t = (np.array(self.z_range) - origin[2]) / direction[2]
+        t = np.clip(np.sort(t), 0, None)
+        if t[1] <= 0:
+            return np.empty(0, dtype=int)
+        segment = origin[:2] + np.outer(t, direction[:2])
+        min_cell = np.floor(segment.min(axis=0) / self.cell_size).astype(int)
+        max_cell = np.floor(segment.max(axis=0) / self.cell_size).astype(int)
+        indices = [self.cells.get((i, j), [])
+                   for i in range(min_cell[0], max_cell[0] + 1)
+                   for j in range(min_cell[1], max_cell[1] + 1)]
+        return np.unique(np.concatenate(indices + [[]]).astype(int))
+
+    def ray_cast(self, origin, direction):
+        """
+        Returns the location, normal, triangle index and distance of the
+        nearest hit of the ray, or four Nones. Uses the Moller-Trumbore
+        intersection of all the candidate triangles at once.
+        """
+        origin = np.array(origin, dtype=float)
+        direction = np.array(direction, dtype=float)
+        indices = self.get_ray_triangles(origin, direction)
+        if len(indices) == 0:
+            return None, None, None, None
+        triangles = self.triangles[indices]
+        edge1 = triangles[:, 1] - triangles[:, 0]
+        edge2 = triangles[:, 2] - triangles[:, 0]
+        p = np.cross(direction, edge2)
+        determinant = np.einsum("ij,ij->i", edge1, p)
+        valid = np.abs(determinant) > 1e-12
+        inverse = np.where(valid, 1 / np.where(valid, determinant, 1), 0)
+        s = origin - triangles[:, 0]
+        u = np.einsum("ij,ij->i", s, p) * inverse
+        q = np.cross(s, edge1)
+        v = (q @ direction) * inverse
+        t = np.einsum("ij,ij->i", edge2, q) * inverse
+        hit = valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0)
+        if not hit.any():
+            return None, None, None, None
+        nearest = np.argmin(np.where(hit, t, np.inf))
+        normal = np.cross(edge1[nearest], edge2[nearest])
+        return (Vector(origin + direction * t[nearest]),
+                Vector(normal / np.linalg.norm(normal)),
+                int(indices[nearest]), float(t[nearest]))
+
+    def overlap(self, other):
+        footprints = (self.vertices[[0, 3, 7, 4], :2],
+                      other.vertices[[0, 3, 7, 4], :2])
+        if (self.vertices[:, 2].max() < other.vertices[:, 2].min() or
+            other.vertices[:, 2].max() < self.vertices[:, 2].min()):
+            return []
+        for footprint in footprints:
+            edges = np.roll(footprint, -1, axis=0) - footprint
+            for axis in np.stack((-edges[:, 1], edges[:, 0]), axis=-1):
+                first = footprints[0] @ axis
+                second = footprints[1] @ axis
+                if first.max() < second.min() or second.max() < first.min():
+                    return []
+        return [(0, 0)]
+
+
+class Collection:
+    """
+    Named collection of data blocks, iterated by values like bpy.data.
+    """
+    def __init__(self, items=()):
+        self.items = {item.name: item for item in items}
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.items.values())[key]
+        return self.items[key]
+
+    def __contains__(self, name):
+        return name in self.items
+
+    def __iter__(self):
+        return iter(list(self.items.values()))
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, name, default=None):
+        return self.items.get(name, default)
+
+    def link(self, item):
+        self.items[item.name] = item
+
+    def remove(self, item, do_unlink=True):
+        self.items.pop(item.name, None)
+
+    def foreach_get(self, attribute, array):
+        values = [getattr(item, attribute) for item in self.items.values()]
+        array[:] = np.array(
+            [list(value) for value in values], dtype=array.dtype).ravel()
+
+
+class Element:
+    """
+    Mesh element, like a vertex, edge or triangle.
+    """
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.__dict__.update(attributes)
+
+
+class Mesh:
+    """
+    Mesh with vertices, edges and faces. Faces are triangle fans, their
+    triangles are created by calc_loop_triangles.
+    """
+    def __init__(self, name, vertices, edges=(), faces=(), vertex_groups=None):
+        vertex_groups = vertex_groups or [[] for _ in vertices]
+        self.name = name
+        self.vertices = Collection([
+            Element(k, co=Vector(vertex), groups=[
+                Element(g, group=g) for g in vertex_groups[k]])
+            for k, vertex in enumerate(vertices)])
+        self.edges = Collection([
+            Element(k, vertices=tuple(edge)) for k, edge in enumerate(edges)])
+        self.faces = [tuple(face) for face in faces]
+        self.loop_triangles = Collection()
+
+    def as_pointer(self):
+        return id(self)
+
+    def calc_loop_triangles(self):
+        self.loop_triangles = Collection([
+            Element(k, vertices=triangle) for k, triangle in enumerate(
+                (face[0], face[k], face[k + 1])
+                for face in self.faces for k in range(1, len(face) - 1))])
+
+
+class Object:
+    """
+    Object whose world matrix always follows its location,
+    rotation and scale.
+    """
+    def __init__(self, name, data=None, bound_box=None, location=(0, 0, 0),
+                 vertex_groups=()):
+        self.name = name
+        self.data = data
+        self.bound_box = bound_box or [(0, 0, 0)] * 8
+        self.location = location
+        self.rotation_euler = (0, 0, 0)
+        self.rotation_mode = "XYZ"
+        self.scale = (1, 1, 1)
+        self.vertex_groups = Collection([
+            Element(name, index=k) for k, name in enumerate(vertex_groups)])
+
+    def __setattr__(self, name, value):
+        if name in ("location", "rotation_euler", "scale"):
+            value = Vector(value)
+        object.__setattr__(self, name, value)
+
+    @property
+    def matrix_world(self):
+        return Matrix.LocRotScale(self.location, self.rotation_euler, self.scale)
+
+    def calc_matrix_camera(self, depsgraph, x=640, y=640, scale_x=1, scale_y=1):
+        """
+        Perspective projection of the default 50 mm camera
+        with the 36 mm sensor.
+        """
+        clip_start, clip_end = 0.1, 1000
+        focal = 2 * 50 / 36
+        aspect = (x * scale_x) / (y * scale_y)
+        projection = np.zeros((4, 4))
+        projection[0, 0] = focal if aspect >= 1 else focal / aspect
+        projection[1, 1] = focal * aspect if aspect >= 1 else focal
+        projection[2, 2] = -(clip_end + clip_start) / (clip_end - clip_start)
+        projection[2, 3] = -2 * clip_end * clip_start / (clip_end - clip_start)
+        projection[3, 2] = -1
+        return Matrix(projection)
+
+
+def create_box_corners(size_x, size_y, size_z):
+    """
+    Returns the 8 bound box corners in Blender order
+    of a box centered on the origin.
+    """
+    return [(sx * size_x / 2, sy * size_y / 2, sz * size_z / 2)
+            for sx, sy, sz in ((-1, -1, -1), (-1, -1, 1), (-1, 1, 1),
+                               (-1, 1, -1), (1, -1, -1), (1, -1, 1),
+                               (1, 1, 1), (1, 1, -1))]
+
+
+def create_box_mesh(name, size_x, size_y, size_z):
+    """
+    Returns the mesh of a box centered on the origin with its six
+    quad faces, with vertices in Blender bound box order.
+    """
+    return Mesh(name, create_box_corners(size_x, size_y, size_z), faces=(
+        (0, 1, 2, 3), (4, 7, 6, 5), (0, 4, 5, 1),
+        (3, 2, 6, 7), (0, 3, 7, 4), (1, 5, 6, 2)))
+
+
+def create_bmesh(mesh):
+    """
+    Returns a bmesh like object whose edges hold their vertices.
+    """
+    vertices = list(mesh.vertices)
+    return types.SimpleNamespace(edges=[
+        Element(edge.name, verts=[vertices[k] for k in edge.vertices])
+        for edge in mesh.edges])
+
+
+def reset_scene(render_resolution=(640, 640)):
+    """
+    Empties the stand-in scene and sets the render resolution.
+    """
+    bpy = sys.modules["bpy"]
+    bpy.data.objects = Collection()
+    bpy.context.scene = types.SimpleNamespace(
+        objects=bpy.data.objects,
+        render=types.SimpleNamespace(
+            resolution_x=render_resolution[0],
+            resolution_y=render_resolution[1],
+            resolution_percentage=100, pixel_aspect_x=1, pixel_aspect_y=1))
+
+
+def install():
+    """
+    Registers minimal stand-ins of the bpy, bpy_extras, bmesh and
+    mathutils modules, so the generator modules can be imported and
+    their placement, camera and annotation code measured without
+    Blender. Code that runs in Blender's C code, like the BVH overlap
+    test and ray casts, is only approximated.
+    """
+    bpy = types.ModuleType("bpy")
+    bpy.data = types.SimpleNamespace(objects=Collection())
+    bpy.context = types.SimpleNamespace(
+        scene=None, evaluated_depsgraph_get=lambda: None)
+    bpy.ops = types.SimpleNamespace()
+    bpy.types = types.SimpleNamespace()
+
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    bvhtree = types.ModuleType("mathutils.bvhtree")
+    bvhtree.BVHTree = BVHTree
+    mathutils.bvhtree = bvhtree
+
+    bpy_extras = types.ModuleType("bpy_extras")
+    bpy_extras.object_utils = types.SimpleNamespace()
+    bmesh = types.ModuleType("bmesh")
+
+    sys.modules.update({
+        "bpy": bpy, "bpy_extras": bpy_extras, "bmesh": bmesh,
+        "mathutils": mathutils, "mathutils.bvhtree": bvhtree})
+    reset_scene()
@@ -0,0 +1,112 @@
+import math
+import random
+
+import bpy_extras
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+
+# Implementations the generator used before the vectorized road sampler,
+# spatial index and camera projection. They are kept here so the
+# benchmarks can compare the new code with them.
+
+
+def get_point_on_line(edge_vertices, max_x, max_y):
+    """
+    Calculate the line equation. Picks a random point on
+    the given line. Returns that point and line angle.
+    Useful equation: (x-x1)/l = (y-y1)/m = (z-z1)/n.
+    """
+    #   Pick random x value between x values of vertex 1 and vertex 2
+    x = random.uniform(edge_vertices[0].co.x, edge_vertices[1].co.x)
+
+    l = edge_vertices[1].co.x - edge_vertices[0].co.x
+    m = edge_vertices[1].co.y - edge_vertices[0].co.y
+    n = edge_vertices[1].co.z - edge_vertices[0].co.z
+
+    # Avoid division by zero
+    l = 0.1 if l == 0 else l
+
+    a = (x - edge_vertices[0].co.x) / l
+    y = a * m + edge_vertices[0].co.y
+    z = a * n + edge_vertices[0].co.z
+
+    try:
+        slope = ((edge_vertices[1].co.y-edge_vertices[0].co.y)/
+                 (edge_vertices[1].co.x-edge_vertices[0].co.x))
+    except ZeroDivisionError:
+        slope = (edge_vertices[1].co.y-edge_vertices[0].co.y)/0.0001
+    angle = math.atan(slope)
+
+    while x > max_x or y > max_y:
+        #   Pick random x value between x values of vertex 1 and vertex 2
+        x = random.uniform(edge_vertices[0].co.x, edge_vertices[1].co.x)
+
+        l = edge_vertices[1].co.x - edge_vertices[0].co.x
+        m = edge_vertices[1].co.y - edge_vertices[0].co.y
+        n = edge_vertices[1].co.z - edge_vertices[0].co.z
+
+        # Avoid division by zero
+        l = 0.1 if l == 0 else l
+
+        a = (x - edge_vertices[0].co.x) / l
+        y = a * m + edge_vertices[0].co.y
+        z = a * n + edge_vertices[0].co.z
+
+        try:
+            slope = ((edge_vertices[1].co.y-edge_vertices[0].co.y)/
+                     (edge_vertices[1].co.x-edge_vertices[0].co.x))
+        except ZeroDivisionError:
+            slope = (edge_vertices[1].co.y-edge_vertices[0].co.y)/0.0001
+        angle = math.atan(slope)
+
+    return (x, y, z), angle
+
+
+def get_random_edge_vertices(bm, max_x, max_y):
+    """
+    Selects a radnom road edge and returns the
+    vertices of that edge.
+    """
+    edge = bm.edges[random.randint(0, len(bm.edges)-1)]
+
+    #   Get edge vertices
+    edge_vertex_1 = edge.verts[0]
+    edge_vertex_2 = edge.verts[1]
+
+    while (
+        (abs(edge_vertex_1.co.x) > max_x or abs(edge_vertex_1.co.y) > max_y) and
+        (abs(edge_vertex_2.co.x) > max_x or abs(edge_vertex_2.co.y) > max_y)):
+        edge = bm.edges[random.randint(0, len(bm.edges)-1)]
+
+        #   Get edge vertices
+        edge_vertex_1 = edge.verts[0]
+        edge_vertex_2 = edge.verts[1]
+
+    return edge_vertex_1, edge_vertex_2
+
+
+def do_objects_overlap(obj1, obj2):
+    """
+    Returns True if the object's bounding boxes are overlapping.
+    """
+    vert1 = [obj1.matrix_world @ Vector(corner) for corner in obj1.bound_box]
+    vert2 = [obj2.matrix_world @ Vector(corner) for corner in obj2.bound_box]
+    # Map vertices to 6 faces
+    faces = [
+        (0, 1, 2, 3), (4, 7, 6, 5), (0, 4, 5, 1),
+        (1, 5, 6, 2), (2, 6, 7, 3), (4, 0, 3, 7)]
+
+    bvh1 = BVHTree.FromPolygons(vert1, faces)
+    bvh2 = BVHTree.FromPolygons(vert2, faces)
+
+    return bool(bvh1.overlap(bvh2))
+
+
+def get_co_in_camera_space(scene, obj, co):
+    """
+    Transforms coordinates in the world space to
+    the camera space.
+    """
+    co_2d = bpy_extras.object_utils.world_to_camera_view(scene, obj, co)
+    return co_2d
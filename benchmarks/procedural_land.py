@@ -0,0 +1,63 @@
+import numpy as np
+
+from bpy_stand_in import Mesh, Object, create_box_corners
+
+
+def create_road_graph(max_x, max_y, blocks_count, rng):
+    """
+    Returns the vertices (V, 3) and edges (E, 2) of a jittered grid of
+    roads with blocks_count blocks along each axis. Grid reaches past
+    the map extent, like the roads exported with the real lands.
+    """
+    xs = np.linspace(-1.2 * max_x, 1.2 * max_x, blocks_count + 1)
+    ys = np.linspace(-1.2 * max_y, 1.2 * max_y, blocks_count + 1)
+    grid_x, grid_y = np.meshgrid(xs, ys, indexing="ij")
+    jitter = (xs[1] - xs[0]) / 5
+    vertices = np.stack((
+        grid_x + rng.uniform(-jitter, jitter, grid_x.shape),
+        grid_y + rng.uniform(-jitter, jitter, grid_y.shape),
+        np.zeros(grid_x.shape)), axis=-1).reshape(-1, 3)
+
+    indices = np.arange(len(vertices)).reshape(grid_x.shape)
+    edges = np.concatenate((
+        np.stack((indices[:-1, :].ravel(), indices[1:, :].ravel()), axis=-1),
+        np.stack((indices[:, :-1].ravel(), indices[:, 1:].ravel()), axis=-1)))
+    return vertices, edges
+
+
+def create_farmland(max_x, max_y, fields_count, rng):
+    """
+    Returns the vertices (V, 3) and quad faces of randomly placed
+    rectangular fields.
+    """
+    centers = rng.uniform(-max_x, max_x, (fields_count, 2))
+    sizes = rng.uniform(20, 120, (fields_count, 2))
+    corners = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)]) / 2
+    vertices = (centers[:, None] + corners[None] * sizes[:, None]).reshape(-1, 2)
+    vertices = np.concatenate((vertices, np.zeros((len(vertices), 1))), axis=1)
+    faces = np.arange(len(vertices)).reshape(-1, 4)
+    return vertices, faces
+
+
+def create_land(bpy, max_x=500, max_y=500, blocks_count=20, fields_count=10,
+                seed=0):
+    """
+    Adds the map, roads and farmland objects of a procedural land to
+    the stand-in scene, with the names the real lands use.
+    """
+    rng = np.random.RandomState(seed)
+    map_obj = Object("EXPORT_GOOGLE_SAT_WM",
+                     bound_box=create_box_corners(2 * max_x, 2 * max_y, 0))
+    map_obj.dimensions = (2 * max_x, 2 * max_y, 0)
+    bpy.data.objects.link(map_obj)
+
+    vertices, edges = create_road_graph(max_x, max_y, blocks_count, rng)
+    bpy.data.objects.link(Object(
+        "Ways:highway", data=Mesh("Ways:highway", vertices, edges)))
+
+    vertices, faces = create_farmland(max_x, max_y, fields_count, rng)
+    bpy.data.objects.link(Object(
+        "Areas:landuse",
+        data=Mesh("Areas:landuse", vertices, faces=faces,
+                  vertex_groups=[[0]] * len(vertices)),
+        vertex_groups=["Tag:landuse=farmland"]))
@@ -0,0 +1,325 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bpy_stand_in
+from procedural_land import create_land
+
+
+BASELINE_FILEPATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+VEHICLE_COUNTS = [10, 100, 1000, 10000]
+CAMERA_COUNTS = [1, 10, 100]
+# Road grid blocks along each axis of the land
+ROAD_DENSITIES = [5, 20, 80]
+# Bound box of a typical car model
+CAR_SIZE = (4.5, 1.8, 1.5)
+
+
+def import_generator():
+    """
+    Imports the dataset generator with the stand-in modules. Config
+    parses the command line, so it gets the arguments it requires.
+    """
+    bpy_stand_in.install()
+    sys.argv = [sys.argv[0], "--", "--cars_count", "0",
+                "--cameras_count", "0", "--lands_count", "0"]
+    return importlib.import_module("create_synthetic_dataset")
+
+
+def import_legacy_reference():
+    """
+    Imports the legacy implementations, which need the stand-in
+    modules of import_generator.
+    """
+    return importlib.import_module("legacy_reference")
+
+
+def measure(function, repeats):
+    """
+    Returns the best wall time in seconds of the given number of calls.
+    Random generators are seeded before every call, so every call
+    does the same work.
+    """
+    times = []
+    for _ in range(0, repeats):
+        random.seed(0)
+        np.random.seed(0)
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def prepare_land(generator, road_density):
+    """
+    Creates the procedural land with the camera and returns its
+    road sampler, coverage grid and extent.
+    """
+    bpy = sys.modules["bpy"]
+    bpy_stand_in.reset_scene(generator.render_resolution)
+    create_land(bpy, blocks_count=road_density)
+    bpy.data.objects.link(bpy_stand_in.Object(
+        "Camera", location=(0, 0, generator.CAMERA_HEIGHT)))
+    max_x = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"].dimensions[0] / 2
+    max_y = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"].dimensions[1] / 2
+    road_sampler = generator.get_road_sampler(max_x, max_y)
+    coverage_grid = generator.create_road_coverage_grid(
+        road_sampler, max_x, max_y, generator.ROAD_COVERAGE_CELL_SIZE)
+    return road_sampler, coverage_grid, max_x, max_y
+
+
+def plan_cars(generator, road_sampler, vehicles_count):
+    """
+    Plans the layout of the given number of cars on the roads.
+    """
+    bound_box = bpy_stand_in.create_box_corners(*CAR_SIZE)
+    model_bounds = np.array([[bound_box[0][0], bound_box[0][1],
+                              bound_box[6][0], bound_box[6][1]]])
+    return generator.plan_vehicle_layout(
+        road_sampler, model_bounds, vehicles_count,
+        generator.car_colors_weights)
+
+
+def add_cars(generator, road_sampler, vehicles_count):
+    """
+    Adds planned cars to the stand-in scene and returns them.
+    All the cars share one box mesh.
+    """
+    bpy = sys.modules["bpy"]
+    bound_box = bpy_stand_in.create_box_corners(*CAR_SIZE)
+    car_mesh = bpy_stand_in.create_box_mesh("Car", *CAR_SIZE)
+    layout = plan_cars(generator, road_sampler, vehicles_count)
+    cars = []
+    for k, (_, position, heading, _) in enumerate(layout):
+        car_obj = bpy_stand_in.Object(
+            "Car." + str(k), data=car_mesh, bound_box=bound_box,
+            location=position)
+        car_obj.rotation_euler = (0, 0, heading)
+        bpy.data.objects.link(car_obj)
+        cars.append(car_obj)
+    return cars
+
+
+def get_car_footprints(generator, cars):
+    """
+    Returns the world space footprints (N, 4, 2) of the cars,
+    as add_new_car stores them in the spatial index.
+    """
+    bound_box = np.array(bpy_stand_in.create_box_corners(*CAR_SIZE))
+    model_bounds = np.concatenate(
+        (bound_box[:, :2].min(axis=0), bound_box[:, :2].max(axis=0)))
+    return generator.get_box_corners(
+        np.array([car.location[:2] for car in cars]),
+        np.array([car.rotation_euler[2] for car in cars]), model_bounds)
+
+
+def check_collisions(generator, footprints):
+    """
+    Checks every footprint against the spatial index of the
+    previous ones and adds it, as add_new_car does.
+    """
+    vehicle_index = generator.create_spatial_index(
+        generator.VEHICLE_INDEX_CELL_SIZE)
+    for footprint in footprints:
+        generator.footprint_collides(vehicle_index, footprint)
+        generator.add_footprint(vehicle_index, footprint)
+
+
+def compute_cameras_visibility(generator, vehicle_bvh, camera_locations,
+                               car_boxes):
+    """
+    Computes the visible and truncated fractions of the cars seen by
+    every camera, as render_images_with_annotations does.
+    """
+    bpy = sys.modules["bpy"]
+    scene = bpy.context.scene
+    cam_obj = bpy.data.objects["Camera"]
+    for camera_location in camera_locations:
+        cam_obj.location = camera_location
+        camera_matrix = generator.get_camera_matrix(scene, cam_obj)
+        indices, visible_boxes = generator.get_visible_boxes(
+            car_boxes, camera_matrix)
+        generator.filter_hidden_vehicles(
+            vehicle_bvh, car_boxes, indices, visible_boxes, camera_matrix)
+
+
+def annotate_cameras(generator, coco_sink, camera_locations, car_boxes):
+    """
+    Projects and annotates the cars for every camera,
+    as render_images_with_annotations does. Records are kept in the
+    sink and never flushed, so the disk latency of the part files
+    is not measured.
+    """
+    bpy = sys.modules["bpy"]
+    scene = bpy.context.scene
+    cam_obj = bpy.data.objects["Camera"]
+    for cam_index, camera_location in enumerate(camera_locations):
+        # add_coco_image would flush the records of the previous image
+        coco_sink["records"].append(
+            {"type": "image", "record": {"id": cam_index}})
+        cam_obj.location = camera_location
+        camera_matrix = generator.get_camera_matrix(scene, cam_obj)
+        visible_boxes = generator.get_visible_boxes(car_boxes, camera_matrix)[1]
+        generator.annotate_vehicle_coco(
+            coco_sink, visible_boxes, scene, cam_index, "car")
+        generator.annotate_vehicles_yolo(visible_boxes, "car")
+
+
+def run_benchmarks(generator, legacy, repeats, quick):
+    """
+    Runs all the benchmarks of the generator code and returns their
+    times in seconds keyed by the benchmark name, together with the
+    times of the legacy implementations doing the same work, keyed by
+    the name of the benchmark they are a reference for.
+    """
+    vehicle_counts = VEHICLE_COUNTS[:3] if quick else VEHICLE_COUNTS
+    camera_counts = CAMERA_COUNTS[:2] if quick else CAMERA_COUNTS
+    results = {}
+    references = {}
+
+    for road_density in ROAD_DENSITIES:
+        bpy = sys.modules["bpy"]
+        prefix = "roads_" + str(road_density) + "/"
+        road_sampler, coverage_grid, max_x, max_y = prepare_land(
+            generator, road_density)
+
+        results[prefix + "road_index"] = measure(lambda: (
+            generator.create_road_coverage_grid(
+                generator.get_road_sampler(max_x, max_y), max_x, max_y,
+                generator.ROAD_COVERAGE_CELL_SIZE),
+            generator.get_farmland_sampler(max_x, max_y)), repeats)
+
+        road_mesh = bpy.data.objects["Ways:highway"].data
+        bm = bpy_stand_in.create_bmesh(road_mesh)
+        for vehicles_count in vehicle_counts:
+            name = prefix + "road_points/" + str(vehicles_count)
+            results[name] = measure(lambda: generator.sample_road_points(
+                road_sampler, vehicles_count), repeats)
+            references[name] = measure(lambda: [
+                legacy.get_point_on_line(
+                    legacy.get_random_edge_vertices(bm, max_x, max_y),
+                    max_x, max_y)
+                for _ in range(0, vehicles_count)], repeats)
+            results[prefix + "layout_planner/" + str(vehicles_count)] = \
+                measure(lambda: plan_cars(
+                    generator, road_sampler, vehicles_count), repeats)
+
+        for cameras_count in camera_counts:
+            results[prefix + "camera_selection/" + str(cameras_count)] = \
+                measure(lambda: generator.decide_camera_locations(
+                    coverage_grid, cameras_count), repeats)
+
+    road_sampler, coverage_grid, max_x, max_y = prepare_land(generator, 20)
+    for vehicles_count in vehicle_counts:
+        prepare_land(generator, 20)
+        np.random.seed(0)
+        cars = add_cars(generator, road_sampler, vehicles_count)
+        suffix = "/" + str(vehicles_count)
+
+        footprints = get_car_footprints(generator, cars).tolist()
+        results["vehicle_collisions" + suffix] = measure(
+            lambda: check_collisions(generator, footprints), repeats)
+        # The legacy code tested every new vehicle against each other one,
+        # the reference times the same number of pair tests as the index
+        pairs = np.random.randint(0, len(cars), (vehicles_count, 2))
+        references["vehicle_collisions" + suffix] = measure(lambda: [
+            legacy.do_objects_overlap(cars[first], cars[second])
+            for first, second in pairs], repeats)
+        results["vehicle_boxes" + suffix] = measure(
+            lambda: generator.get_boxes_array(
+                generator.get_all_cars_bounding_boxes()), repeats)
+
+        car_boxes = generator.get_boxes_array(
+            generator.get_all_cars_bounding_boxes())
+        vehicle_bvh = generator.create_vehicle_bvh(cars)
+        scene = sys.modules["bpy"].context.scene
+        frame_boxes = np.random.uniform(0, 1, (vehicles_count, 4))
+        frame_boxes[:, 2:] = np.maximum(frame_boxes[:, :2], frame_boxes[:, 2:])
+        results["coco_yolo_boxes" + suffix] = measure(lambda: (
+            generator.return_coco_boxes(frame_boxes, scene),
+            generator.return_yolo_boxes(frame_boxes)), repeats)
+
+        for cameras_count in camera_counts:
+            np.random.seed(0)
+            camera_locations = generator.decide_camera_locations(
+                coverage_grid, cameras_count)
+            with tempfile.TemporaryDirectory() as parts_path:
+                results["annotation" + suffix + "/" + str(cameras_count)] = \
+                    measure(lambda: annotate_cameras(
+                        generator, generator.create_coco_sink(parts_path, 500),
+                        camera_locations, car_boxes), repeats)
+            results["visibility" + suffix + "/" + str(cameras_count)] = \
+                measure(lambda: compute_cameras_visibility(
+                    generator, vehicle_bvh, camera_locations, car_boxes),
+                    repeats)
+
+    return results, references
+
+
+def print_results(results, references, baseline, tolerance, min_time):
+    """
+    Prints the times next to the legacy reference and the baseline and
+    returns the names of the benchmarks that are more than tolerance
+    times slower than the baseline. Benchmarks faster than min_time
+    seconds are too noisy to be compared.
+    """
+    regressions = []
+    print("Benchmark".ljust(48) + "time [ms]".rjust(12) +
+          "legacy".rjust(12) + "baseline".rjust(12) + "ratio".rjust(8))
+    for name, seconds in results.items():
+        line = name.ljust(48) + str(round(seconds * 1000, 2)).rjust(12)
+        line += (str(round(references[name] * 1000, 2)) if name in references
+                 else "").rjust(12)
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            line += (str(round(baseline[name] * 1000, 2)).rjust(12) +
+                     str(round(ratio, 2)).rjust(8))
+            if ratio > tolerance and seconds > min_time:
+                regressions.append(name)
+                line += "  SLOWER"
+        print(line.rstrip())
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', dest='repeats', type=int, default=3)
+    parser.add_argument('--quick', dest='quick', action='store_true')
+    parser.add_argument('--save_baseline', dest='save_baseline', action='store_true')
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=1.5)
+    parser.add_argument('--min_time', dest='min_time', type=float, default=0.001)
+    args = parser.parse_args()
+
+    generator = import_generator()
+    results, references = run_benchmarks(
+        generator, import_legacy_reference(), args.repeats, args.quick)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILEPATH):
+        with open(BASELINE_FILEPATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    regressions = print_results(
+        results, references, baseline, args.tolerance, args.min_time)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILEPATH, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.platform(),
+                       "python": platform.python_version(),
+                       "results": baseline}, f, indent=2)
+        print("\nSaved the baseline to " + BASELINE_FILEPATH)
+    elif regressions:
+        print("\n" + str(len(regressions)) + " benchmarks are slower than " +
+              "the baseline")
+        sys.exit(1)
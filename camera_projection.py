@@ -0,0 +1,77 @@
+import numpy as np
+
+
+def project_points(points, camera_matrix):
+    """
+    Projects world space points (..., 3) with the 4x4 camera matrix
+    (projection @ view) into the normalized camera frame, where (0, 0)
+    is the bottom left and (1, 1) the top right corner of the image.
+    Same convention as bpy_extras.object_utils.world_to_camera_view.
+    """
+    points = np.asarray(points, dtype=float)
+    homogeneous = np.concatenate(
+        (points, np.ones(points.shape[:-1] + (1,))), axis=-1)
+    clip = homogeneous @ np.asarray(camera_matrix, dtype=float).T
+    return (clip[..., :2] / clip[..., 3:4] + 1) / 2
+
+
+def unproject_points(camera_matrix, frame_x, frame_y):
+    """
+    Returns the world space points (..., 3) on the near and the far
+    clipping plane of the rays through the given camera frame
+    coordinates, in the convention of project_points.
+    """
+    inverse_matrix = np.linalg.inv(np.asarray(camera_matrix, dtype=float))
+    ray_points = []
+    for ndc_z in (-1, 1):
+        clip = np.stack((frame_x * 2 - 1, frame_y * 2 - 1,
+                         np.full_like(frame_x, ndc_z), np.ones_like(frame_x)),
+                        axis=-1)
+        world = clip @ inverse_matrix.T
+        ray_points.append(world[..., :3] / world[..., 3:4])
+    return ray_points[0], ray_points[1]
+
+
+def clip_projected_boxes(co_2d):
+    """
+    Takes projected box corners (N, 4, 2) and returns the indices of the
+    boxes that have at least one corner inside the image together with
+    their (min_x, min_y, max_x, max_y) boxes clamped to the image.
+    """
+    co_2d = np.asarray(co_2d, dtype=float).reshape(-1, 4, 2)
+    corner_inside = ((co_2d >= 0) & (co_2d <= 1)).all(axis=-1)
+    # All four points must be out of the image to ignore the vehicle
+    visible = np.nonzero(corner_inside.any(axis=-1))[0]
+
+    clamped = np.clip(co_2d[visible], 0, 1)
+    boxes = np.concatenate(
+        (clamped.min(axis=1), clamped.max(axis=1)), axis=-1)
+    return visible, boxes
+
+
+def get_visible_boxes(vehicle_boxes, camera_matrix):
+    """
+    Projects all vehicle boxes (N, 4, 3) at once and returns the
+    indices and clamped camera frame boxes of the visible ones.
+    """
+    vehicle_boxes = np.asarray(vehicle_boxes, dtype=float).reshape(-1, 4, 3)
+    return clip_projected_boxes(project_points(vehicle_boxes, camera_matrix))
+
+
+def get_tile_matrix(camera_matrix, tiles_per_axis, tile_index):
+    """
+    Returns the camera matrix of one tile of the frame, counted row by
+    row from the top left tile, so the tile spans the whole camera
+    frame of the returned matrix.
+    """
+    tiles_x, tiles_y = tiles_per_axis
+    column = tile_index % tiles_x
+    # Camera frame y grows upwards, tiles are counted from the top
+    row = tiles_y - 1 - tile_index // tiles_x
+    # Scales the tile to the clip space and moves its center to the origin
+    tile_transform = np.array([
+        [tiles_x, 0, 0, tiles_x - 2 * column - 1],
+        [0, tiles_y, 0, tiles_y - 2 * row - 1],
+        [0, 0, 1, 0],
+        [0, 0, 0, 1]])
+    return tile_transform @ np.asarray(camera_matrix, dtype=float)
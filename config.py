@@ -2,6 +2,9 @@ import argparse
 import os
 import sys
 
+sys.path.append(os.path.dirname(__file__))
+from asset_manifest import get_asset_files
+
 
 if '--' in sys.argv:
     argv = sys.argv[sys.argv.index('--') + 1:]
@@ -9,10 +12,20 @@ parser = argparse.ArgumentParser()
 parser.add_argument('-c', '--cars_count', dest='cars_count', type=int, required=True)
 parser.add_argument('-i', '--cameras_count', dest='cameras_count', type=int, required=True)
 parser.add_argument('-l', '--lands_count', dest='lands_count', type=int, required=True)
+parser.add_argument('-r', '--resume', dest='resume', action='store_true')
+parser.add_argument('-s', '--seed', dest='seed', type=int, default=None)
+parser.add_argument('-d', '--dataset_path', dest='dataset_path', default=None)
+parser.add_argument('-f', '--first_index', dest='first_index', type=int, default=0)
 args = parser.parse_known_args(argv)[0]
 
 MAIN_PATH = "/home/pc4/Projekti/SyntheticCarDataset"
 DATASET_PATH = "/home/pc4/Projekti/SyntheticCarDataset/dataset"
+if args.dataset_path is not None:
+    DATASET_PATH = args.dataset_path
+# Seed of the random generators, random if None
+SEED = args.seed
+# Index of the first image, so workers of one dataset use different indices
+FIRST_IMAGE_INDEX = args.first_index
 
 NUMBER_OF_CARS = args.cars_count #30
 NUMBER_OF_FARM_VEHICLES = 30
@@ -22,23 +35,126 @@ render_resolution = [640, 640]
 # NUMBER_OF_CAMERAS * LANDS_COUNT
 NUMBER_OF_CAMERAS = args.cameras_count #2
 LANDS_COUNT = args.lands_count #2
+# Continue the previous run from its run_manifest.json
+RESUME = args.resume
 CAMERA_HEIGHT = 221
+# Number of images whose coco annotations are stored in one label_parts file
+COCO_IMAGES_PER_PART = 500
+# Size in meters of the road coverage grid cells used to place cameras
+ROAD_COVERAGE_CELL_SIZE = 5
+# Minimal meters of road that must be visible from each camera
+MIN_ROAD_COVERAGE = 10
+# What to do with cameras that see no vehicles: "keep", "skip" or "replace"
+EMPTY_CAMERA_POLICY = "replace"
+MAX_CAMERA_REPLACEMENTS = 20
+# Trace only the padded region around the visible vehicles in final renders
+CROP_RENDER = True
+# Padding of the cropped region as a fraction of the image size
+CROP_RENDER_PADDING = 0.05
 
 ADD_TRACTORS = False
 
+# "cycles" renders the backgrounds separately, "orthophoto" crops the
+# satellite texture and "view_layer" renders the backgrounds as a second
+# view layer of the final render call
+BACKGROUND_MODE = "cycles"
+# Compare the first orthophoto background of each land with a Cycles render
+VERIFY_BACKGROUNDS = False
+MAX_BACKGROUND_DIFFERENCE = 0.02
+# Delete the rendered backgrounds once the final image is composited
+DELETE_BACKGROUNDS = False
+
+# "files" writes every image and label to its own file, "tar_shards"
+# writes images with their yolo and coco labels into tar shards
+OUTPUT_FORMAT = "files"
+# Number of images in one tar shard
+SAMPLES_PER_SHARD = 1000
+# Encode and write images and labels in a pool of threads while the
+# next image is rendered, instead of letting Blender write them
+ASYNC_OUTPUT = True
+OUTPUT_WORKERS = 4
+# Rendering waits when this many images are not written yet
+MAX_PENDING_OUTPUTS = 8
+# Format of the images written by the pool: "png", or "jpg" and "webp"
+# which need Pillow
+IMAGE_FORMAT = "png"
+# zlib compression level from 0 to 9 for png, quality for jpg and webp
+IMAGE_COMPRESSION = 6
+
+# Compute the visible and truncated fraction of every annotated vehicle
+# by casting rays against all the vehicle meshes
+COMPUTE_VISIBILITY = True
+# Rays per axis of the projected box of each vehicle
+VISIBILITY_SAMPLES = 4
+# Vehicles with a smaller visible fraction are not annotated
+MIN_VISIBILITY = 0.0
+# Append the visible and truncated fractions as two extra columns of the
+# yolo labels, coco annotations always have them
+YOLO_VISIBILITY = False
+
+# Render one large frame per camera and slice it into tiles of the render
+# resolution, with the same meters per pixel as a single image
+TILE_RENDER = False
+# Tiles along the x and y axis of the large frame
+RENDER_TILES = [3, 3]
+TILES_PER_AXIS = RENDER_TILES if TILE_RENDER else [1, 1]
+TILES_COUNT = TILES_PER_AXIS[0] * TILES_PER_AXIS[1]
+
+# Render every camera pose this many times with a different lighting and
+# car colors, reusing the scene and the annotations. The first variant
+# keeps the look of the land
+LIGHTING_VARIANTS = 1
+# Ranges the other variants are drawn from
+VARIANT_SUN_HOURS = [9, 15]
+VARIANT_SUN_MONTHS = [4, 9]
+VARIANT_SUN_ENERGY = [3, 7]
+VARIANT_SATURATION = [0.9, 1.0]
+VARIANT_EXPOSURE = [1.0, 1.3]
+VARIANT_RECOLOR = True
+IMAGES_PER_CAMERA = TILES_COUNT * LIGHTING_VARIANTS
+
+# Choose the cameras first and place vehicles only on the roads and
+# farmland they see, instead of anywhere on the land
+CAMERA_FIRST_PLACEMENT = False
+# Meters added around every camera view, so vehicles just outside of the
+# image still cast their shadows into it
+PLACEMENT_MARGIN = 15
+# Average number of cars seen by one camera, used instead of NUMBER_OF_CARS
+# with CAMERA_FIRST_PLACEMENT
+CARS_PER_IMAGE = 20
+
+# Remove the orphan data blocks of the previous layout before every land
+# and stop the worker after the land that leaves it using more than
+# MAX_WORKER_MEMORY_MB of memory, so launch_workers.py restarts it
+MEMORY_BOUNDED = False
+MAX_WORKER_MEMORY_MB = 16000
+
+# Size in meters of the grid cells used for vehicle collision checks
+VEHICLE_INDEX_CELL_SIZE = 10
+# Plan the layout of all cars in NumPy before adding any of them to the scene
+BATCH_PLACEMENT = True
+
 ALL_VEHICLES = ["car", "tractor"]
 
-CAR_MODELS_COUNT = len([f for f in os.listdir(os.path.join(MAIN_PATH, "Vehicles", "Cars"))
-     if f.endswith(".fbx") and
-     os.path.isfile(os.path.join(MAIN_PATH, "Vehicles", "Cars", f))])
+# Asset files can have any names, they do not have to be numbered
+CAR_MODEL_FILES = get_asset_files(
+    os.path.join(MAIN_PATH, "Vehicles", "Cars"), ".fbx")
+TRACTOR_MODEL_FILES = get_asset_files(
+    os.path.join(MAIN_PATH, "Vehicles", "Tractors"), ".fbx")
+LAND_FILES = get_asset_files(os.path.join(MAIN_PATH, "Lands"), ".blend")
 
-TRACTOR_MODELS_COUNT = len([f for f in os.listdir(os.path.join(MAIN_PATH, "Vehicles", "Tractors"))
-     if f.endswith(".fbx") and
-     os.path.isfile(os.path.join(MAIN_PATH, "Vehicles", "Tractors", f))])
+CAR_MODELS_COUNT = len(CAR_MODEL_FILES)
+TRACTOR_MODELS_COUNT = len(TRACTOR_MODEL_FILES)
+LANDS_MODELS_COUNT = len(LAND_FILES)
 
-LANDS_MODELS_COUNT = len([f for f in os.listdir(os.path.join(MAIN_PATH, "Lands"))
-     if f.endswith(".blend") and
-     os.path.isfile(os.path.join(MAIN_PATH, "Lands", f))])
+# Written by index_assets.py, footprints of the models are read from it
+# instead of importing the models
+ASSET_MANIFEST_PATH = os.path.join(MAIN_PATH, "asset_manifest.json")
+# Written by bake_vehicle_library.py, vehicle models are loaded from it
+# instead of the fbx files if it exists
+VEHICLE_LIBRARY_PATH = os.path.join(MAIN_PATH, "Vehicles", "vehicles.blend")
+# Link the models from the library instead of appending them
+LINK_VEHICLE_LIBRARY = False
 
 car_colors = [
     (1.00, 1.00, 1.00, 1.00),   # white
@@ -5,321 +5,577 @@ import random
 import sys
 
 import bpy
-import bpy_extras
-import bmesh
-import geopandas as gpd
-from mathutils import Vector
+from mathutils import Matrix, Vector
 from mathutils.bvhtree import BVHTree
 import numpy as np
-import pandas as pd
-from shapely.geometry import Point, Polygon
 
 sys.path.append(os.path.dirname(__file__))
 from config import *
 from annotation_tools import *
+from asset_manifest import get_valid_entry, load_asset_manifest
+from annotation_sinks import (
+    add_coco_annotation, add_coco_image, create_coco_sink, flush_coco_sink,
+    get_next_annotation_id, merge_coco_parts, truncate_coco_parts,
+    write_yolo_labels)
+from camera_projection import get_tile_matrix, get_visible_boxes
+from farmland_sampler import (
+    create_farmland_sampler, crop_farmland_sampler, sample_farmland_points)
+from instrumentation import (
+    count, finish_land, get_memory_usage, record_memory, start_land, timed,
+    timed_stage)
+from orthophoto import crop_orthophoto, get_pixel_difference
+from output_writer import (
+    close_output_writer, create_output_writer, encode_image,
+    flush_output_writer, submit_output, write_file)
+from road_coverage import (
+    create_road_coverage_grid, get_camera_cells, sample_camera_locations)
+from road_sampler import (
+    create_road_sampler, crop_road_sampler, sample_road_points)
+from run_manifest import (
+    RESTART_EXIT_CODE, create_run_manifest, load_run_manifest,
+    record_finished_land, save_run_manifest, set_random_states)
+from scene_planner import get_box_corners, plan_vehicle_layout
+from spatial_index import (
+    add_footprint, create_spatial_index, footprint_collides)
+from tar_shards import add_shard_sample, create_shard_writer
+from visibility import compute_visibility
+from vehicle_cache import (
+    add_vehicle_instance, clear_vehicle_cache, get_template_footprint,
+    get_vehicle_template, print_cache_stats, remove_vehicle_instance,
+    set_vehicle_library)
 
 
 iteration = 0
+asset_manifest = load_asset_manifest(ASSET_MANIFEST_PATH)
 
-def random_points_in_polygon(n, max_x, max_y):
+def render_scene(write_still=False):
     """
-    Returns arrays of x and y coordinates with the size n
-    and inside polygon bounding box.
+    Renders the scene. All renders go through this function,
+    so render calls are counted per land.
     """
-    x = np.random.uniform(-max_x, max_x, n)
-    y = np.random.uniform(-max_y, max_y, n)
-    return x, y
+    count("render_calls")
+    bpy.ops.render.render(write_still = write_still)
 
 
-def import_map_and_roads():
+def get_image_index(cam_index, land_iteration=None, tile_index=0, variant=0):
     """
-    Loads some blend file that has map saved with needed
-    emission shader and highways data.
+    Returns the dataset index of the image taken by the given camera
+    on the given land iteration, current iteration by default. Every
+    camera takes IMAGES_PER_CAMERA images, one per tile of each
+    lighting variant.
     """
-    current_map_index = random.randint(1, LANDS_MODELS_COUNT)
-    bpy.ops.wm.open_mainfile(filepath=os.path.join(
-        MAIN_PATH, "Lands", str(current_map_index) + ".blend"))
+    if land_iteration is None:
+        land_iteration = iteration
+    return (FIRST_IMAGE_INDEX + tile_index + TILES_COUNT*variant +
+            IMAGES_PER_CAMERA*(cam_index + NUMBER_OF_CAMERAS*land_iteration))
 
 
-def add_farm_vehicles(max_x, max_y):
+def schedule_lands(lands_count):
     """
-    Adds farm vehicles, such as tractors and havesters, to the farmland
-    if there is any farmland available.
+    Draws the land of every iteration up front, with replacement as
+    before, and orders the iterations so that all the iterations of
+    one land follow each other and the land is loaded only once.
     """
-    scene = bpy.context.scene
-    view_layer = bpy.context.view_layer
+    return sorted(random.choice(LAND_FILES) for _ in range(0, lands_count))
 
-    try:
-        bpy.ops.object.select_all(action="DESELECT")
-        bpy.data.objects["Areas:landuse"].select_set(True)
-        view_layer.objects.active = bpy.data.objects["Areas:landuse"]
-        farmland_vertices = []
-
-        for vert in bpy.context.object.data.vertices:
-            if (bpy.context.object.vertex_groups["Tag:landuse=farmland"].index
-                in [i.group for i in vert.groups]):
-                farmland_vertices.append((vert.co.x, vert.co.y))
-
-        gdf_poly = gpd.GeoDataFrame(
-            index=["myPoly"], geometry=[Polygon(farmland_vertices)])
-
-        df = pd.DataFrame()
-        df["points"] = list(zip(
-            random_points_in_polygon(NUMBER_OF_FARM_VEHICLES, max_x, max_y)[0],
-            random_points_in_polygon(NUMBER_OF_FARM_VEHICLES, max_x, max_y)[1]))
-        df["points"] = df["points"].apply(Point)
-        gdf_points = gpd.GeoDataFrame(df, geometry="points")
-
-        s_join = gpd.tools.sjoin(
-            gdf_points, gdf_poly, predicate="within", how="left")
-
-        # Keep points in "myPoly"
-        points_in_farmland = gdf_points[s_join.index_right=="myPoly"]
-
-        for i in range(0, len(points_in_farmland)):
-            bpy.ops.import_scene.fbx(filepath = os.path.join(
-                MAIN_PATH, "Vehicles", "Tractors", "Tractor" +
-                str(random.randint(1, TRACTOR_MODELS_COUNT)) + ".fbx"))
-
-            new_vehicle_obj = bpy.context.selected_objects[0]
-            scene.cursor.location = (
-                points_in_farmland.iloc[i].points.x,
-                points_in_farmland.iloc[i].points.y, 0)
-            new_vehicle_obj.matrix_world.translation = scene.cursor.location
-            new_vehicle_obj.rotation_mode = "XYZ"
-            new_vehicle_obj.rotation_euler = (0, 0, random.uniform(0, math.pi))
-
-        to_place_on_roads = 1/2
-
-    except KeyError:
-        to_place_on_roads = 1
 
-    farm_vehicles_count = 0
-    while farm_vehicles_count < NUMBER_OF_CARS*to_place_on_roads:
-        bpy.ops.object.select_all(action="DESELECT")
-        bpy.data.objects["Ways:highway"].select_set(True)
-        view_layer.objects.active = bpy.data.objects["Ways:highway"]
+@timed
+def import_map_and_roads(land_file):
+    """
+    Loads the blend file of the given land that has map saved
+    with needed emission shader and highways data.
+    """
+    bpy.ops.wm.open_mainfile(filepath=os.path.join(
+        MAIN_PATH, "Lands", land_file))
+    # Opening the file frees all previously imported vehicle models
+    clear_vehicle_cache()
+    set_color_management()
 
-        bpy.ops.object.mode_set(mode="EDIT")
 
-        bm = bmesh.from_edit_mesh(bpy.data.objects["Ways:highway"].data)
+def set_color_management():
+    """
+    Sets the Standard view transform without any look, exposure, gamma
+    or curves, to keep the map color same as original. The land file
+    brings its own color management, and images encoded in Python
+    assume this one.
+    """
+    view_settings = bpy.context.scene.view_settings
+    view_settings.view_transform = "Standard"
+    view_settings.look = "None"
+    view_settings.exposure = 0
+    view_settings.gamma = 1
+    view_settings.use_curve_mapping = False
 
-        bm.edges.ensure_lookup_table()
-        edge_vertices = get_random_edge_vertices(bm, max_x, max_y)
-        location_and_rotation = get_point_on_line(edge_vertices, max_x, max_y)
 
-        scene.cursor.location = location_and_rotation[0]
+@timed
+def clear_scene_layout():
+    """
+    Brings the loaded land back to the state it had right after loading,
+    so another vehicle layout can be generated on it. Removes vehicles,
+    camera, sun and shadow catcher, but keeps the imported vehicle
+    models and the land data.
+    """
+    scene = bpy.context.scene
+    for obj in list(scene.objects):
+        if obj.name.startswith("Car") or obj.name.startswith("Tractor"):
+            remove_vehicle_instance(obj)
+
+    for obj_name, data_collection in (("Camera", bpy.data.cameras),
+                                      ("Sun", bpy.data.lights),
+                                      ("Plane", bpy.data.meshes)):
+        obj = bpy.data.objects.get(obj_name)
+        if obj is not None:
+            obj_data = obj.data
+            bpy.data.objects.remove(obj, do_unlink=True)
+            if obj_data.users == 0:
+                data_collection.remove(obj_data)
+
+    if "Background" in scene.view_layers:
+        scene.view_layers.remove(scene.view_layers["Background"])
+    if "Shadow Catcher" in bpy.data.collections:
+        bpy.data.collections.remove(bpy.data.collections["Shadow Catcher"])
+    scene.render.film_transparent = False
+    scene.render.use_border = False
+
+
+@timed
+def purge_orphan_data():
+    """
+    Removes the data blocks that nothing uses anymore, like the
+    materials of removed vehicles and the previous camera and sun.
+    Vehicle templates have a fake user, so they are kept. Linked data
+    only comes from the vehicle library and is kept as well.
+    """
+    purged_count = bpy.data.orphans_purge(
+        do_local_ids=True, do_linked_ids=False, do_recursive=True)
+    count("purged_data_blocks", purged_count)
 
-        bpy.ops.import_scene.fbx(filepath = os.path.join(
-            MAIN_PATH, "Vehicles", "Tractors", "Tractor" +
-            str(random.randint(1, TRACTOR_MODELS_COUNT)) + ".fbx"))
-        new_vehicle_obj = bpy.context.selected_objects[0]
-        new_vehicle_obj.matrix_world.translation = scene.cursor.location
-        new_vehicle_obj.location = location_and_rotation[0]
-        new_vehicle_obj.rotation_mode = "XYZ"
-        new_vehicle_obj.rotation_euler = (
-            0, 0, location_and_rotation[1] + math.pi*random.randint(0,1))
-        farm_vehicles_count += 1
 
-        for obj in bpy.data.objects:
-            if obj.name.startswith("Car") or obj.name.startswith("Tractor"):
-                if do_objects_overlap(new_vehicle_obj, obj):
-                    bpy.ops.object.delete()
-                    farm_vehicles_count -= 1
-                    break
+def get_data_blocks_counts():
+    """
+    Returns the number of data blocks in each bpy.data collection
+    that can grow during a run.
+    """
+    return {name: len(getattr(bpy.data, name)) for name in (
+        "objects", "meshes", "materials", "images", "textures",
+        "node_groups", "cameras", "lights", "collections", "actions")}
 
 
-def add_new_car(max_x, max_y):
+def get_farmland_sampler(max_x, max_y):
     """
-    Adds a car model to the scene and positions it
-    on the road with correct rotation.
+    Reads the farmland faces of the current land once and returns the
+    farmland sampler clipped to the map extent, or None if the land
+    has no farmland.
+    """
+    landuse_obj = bpy.data.objects.get("Areas:landuse")
+    if landuse_obj is None or \
+        "Tag:landuse=farmland" not in landuse_obj.vertex_groups:
+        return None
+
+    landuse_mesh = landuse_obj.data
+    farmland_group = landuse_obj.vertex_groups["Tag:landuse=farmland"].index
+    is_farmland = np.array([
+        any(group.group == farmland_group for group in vert.groups)
+        for vert in landuse_mesh.vertices], dtype=bool)
+
+    vertices = np.empty(len(landuse_mesh.vertices) * 3)
+    landuse_mesh.vertices.foreach_get("co", vertices)
+    landuse_mesh.calc_loop_triangles()
+    triangles = np.empty(len(landuse_mesh.loop_triangles) * 3, dtype=np.int32)
+    landuse_mesh.loop_triangles.foreach_get("vertices", triangles)
+    triangles = triangles.reshape(-1, 3)
+    triangles = triangles[np.all(is_farmland[triangles], axis=1)]
+    return create_farmland_sampler(vertices, triangles, max_x, max_y)
+
+
+@timed
+def add_farm_vehicles(road_sampler, farmland_sampler, vehicle_index,
+                      cars_count=NUMBER_OF_CARS):
+    """
+    Adds farm vehicles, such as tractors and havesters, to the farmland
+    if there is any farmland available. Footprints of the added vehicles
+    are stored in the given spatial index. The number of farm vehicles
+    on the roads depends on the number of cars, their layout is planned
+    around the vehicles of the index, so no tractor is removed again.
     """
-    bpy.ops.object.select_all(action="DESELECT")
-    bpy.data.objects["Ways:highway"].select_set(True)
-    bpy.context.view_layer.objects.active = bpy.data.objects["Ways:highway"]
+    scene = bpy.context.scene
 
-    bpy.ops.object.mode_set(mode="EDIT")
+    if farmland_sampler is not None:
+        farmland_points = sample_farmland_points(
+            farmland_sampler, NUMBER_OF_FARM_VEHICLES)
+        for point in farmland_points:
+            new_vehicle_obj = add_vehicle_instance(
+                random.choice(get_model_filepaths("Tractors")),
+                copy_material=False, vehicle_name="Tractor")
+            scene.cursor.location = (point[0], point[1], 0)
+            new_vehicle_obj.matrix_world.translation = scene.cursor.location
+            new_vehicle_obj.rotation_mode = "XYZ"
+            new_vehicle_obj.rotation_euler = (0, 0, random.uniform(0, math.pi))
+            add_footprint(vehicle_index, get_vehicle_footprint(new_vehicle_obj))
 
-    bm = bmesh.from_edit_mesh(bpy.data.objects["Ways:highway"].data)
-    #verts = [vert.co for vert in bm.verts]
+        to_place_on_roads = 1/2
+    else:
+        to_place_on_roads = 1
 
-    bm.edges.ensure_lookup_table()
+    # Road tractors are planned around the cars and farmland tractors,
+    # so only the accepted ones are added to the scene
+    model_filepaths = get_model_filepaths("Tractors")
+    model_bounds = get_model_bounds(model_filepaths)
+    planner_stats = {}
+    layout = plan_vehicle_layout(
+        road_sampler, model_bounds, math.ceil(cars_count*to_place_on_roads),
+        [1], existing_corners=np.array(vehicle_index["footprints"]),
+        stats=planner_stats, cell_size=VEHICLE_INDEX_CELL_SIZE)
+    count("tractor_collisions", planner_stats["rejected"])
+
+    for model_id, position, heading, _ in layout:
+        new_vehicle_obj = add_vehicle_instance(
+            model_filepaths[model_id], copy_material=False,
+            vehicle_name="Tractor")
+        new_vehicle_obj.location = position
+        new_vehicle_obj.rotation_mode = "XYZ"
+        new_vehicle_obj.rotation_euler = (0, 0, heading)
 
-    edge_vertices = get_random_edge_vertices(bm, max_x, max_y)
+        footprint = get_box_corners(
+            np.array([position]), np.array([heading]),
+            model_bounds[model_id])[0]
+        add_footprint(vehicle_index, footprint.tolist())
 
-    location_and_rotation = get_point_on_line(edge_vertices, max_x, max_y)
 
-    bpy.context.scene.cursor.location = location_and_rotation[0]
+def add_new_car(road_sampler, vehicle_index):
+    """
+    Adds a car model to the scene and positions it
+    on the road with correct rotation. The car is removed
+    again if it overlaps any vehicle in the spatial index.
+    """
+    points, headings = sample_road_points(road_sampler, 1)
+    location_and_rotation = (tuple(points[0]), headings[0])
 
-    bpy.ops.import_scene.fbx(filepath = os.path.join(
-        MAIN_PATH, "Vehicles", "Cars", "Car" +
-        str(random.randint(1, CAR_MODELS_COUNT)) + ".fbx"))
-    car_obj = bpy.context.selected_objects[0]
-    car_obj.matrix_world.translation = bpy.context.scene.cursor.location
+    car_obj = add_vehicle_instance(
+        random.choice(get_model_filepaths("Cars")), vehicle_name="Car")
+    car_obj.location = location_and_rotation[0]
     car_obj.rotation_mode = "XYZ"
     car_obj.rotation_euler = (
         0, 0, location_and_rotation[1] + math.pi*random.randint(0,1))
 
-    edit_material(car_obj)
+    # If added car overlaps another one, delete it
+    footprint = get_vehicle_footprint(car_obj)
+    if footprint_collides(vehicle_index, footprint):
+        remove_vehicle_instance(car_obj)
+        count("car_collisions")
+        return 0
 
-    for obj in bpy.data.objects:
-        if obj.name.startswith("Car"):
-            # If added car overlaps another one, delete it
-            if do_objects_overlap(car_obj, obj):
-                bpy.ops.object.delete()
-                return 0
+    add_footprint(vehicle_index, footprint)
+    edit_material(car_obj)
 
     return 1
 
 
-def do_objects_overlap(obj1, obj2):
+def get_vehicle_footprint(obj):
     """
-    Returns True if the object's bounding boxes are overlapping.
+    Returns the world space (x, y) corners of the bottom face of
+    the object's bounding box. The transform is built from the object
+    location, rotation and scale, so it is correct even before
+    the scene is updated.
     """
-    vert1 = [obj1.matrix_world @ Vector(corner) for corner in obj1.bound_box]
-    vert2 = [obj2.matrix_world @ Vector(corner) for corner in obj2.bound_box]
-    # Map vertices to 6 faces
-    faces = [
-        (0, 1, 2, 3), (4, 7, 6, 5), (0, 4, 5, 1),
-        (1, 5, 6, 2), (2, 6, 7, 3), (4, 0, 3, 7)]
+    matrix = Matrix.LocRotScale(obj.location, obj.rotation_euler, obj.scale)
+    # Bottom face corners ordered around the box
+    return [(matrix @ Vector(obj.bound_box[k])).xy[:] for k in (0, 3, 7, 4)]
 
-    bvh1 = BVHTree.FromPolygons(vert1, faces)
-    bvh2 = BVHTree.FromPolygons(vert2, faces)
 
-    return bool(bvh1.overlap(bvh2))
+def get_model_filepaths(vehicle_folder):
+    """
+    Returns the filepaths of all the models of one vehicle type,
+    "Cars" or "Tractors".
+    """
+    model_files = CAR_MODEL_FILES if vehicle_folder == "Cars" else \
+        TRACTOR_MODEL_FILES
+    return [os.path.join(MAIN_PATH, "Vehicles", vehicle_folder, model_file)
+            for model_file in model_files]
 
 
-def get_point_on_line(edge_vertices, max_x, max_y):
+def get_model_bounds(model_filepaths):
     """
-    Calculate the line equation. Picks a random point on
-    the given line. Returns that point and line angle.
-    Useful equation: (x-x1)/l = (y-y1)/m = (z-z1)/n.
+    Returns the local footprint bounds (min_x, min_y, max_x, max_y) of
+    each model, scaled the same way as the placed vehicles are. Bounds
+    are read from the asset manifest, models that are missing in it or
+    changed since indexing are imported.
     """
-    #   Pick random x value between x values of vertex 1 and vertex 2
-    x = random.uniform(edge_vertices[0].co.x, edge_vertices[1].co.x)
+    model_bounds = []
+    for model_filepath in model_filepaths:
+        entry = get_valid_entry(
+            asset_manifest, "vehicles", MAIN_PATH,
+            os.path.relpath(model_filepath, MAIN_PATH).replace(os.sep, "/"))
+        if entry is not None:
+            model_bounds.append(entry["footprint"])
+        else:
+            model_bounds.append(get_template_footprint(
+                get_vehicle_template(model_filepath)[0]))
+    return np.array(model_bounds)
 
-    l = edge_vertices[1].co.x - edge_vertices[0].co.x
-    m = edge_vertices[1].co.y - edge_vertices[0].co.y
-    n = edge_vertices[1].co.z - edge_vertices[0].co.z
 
-    # Avoid division by zero
-    l = 0.1 if l == 0 else l
+def get_land_extent(land_file):
+    """
+    Returns the half width and half height of the map of the opened
+    land. The extent is read from the asset manifest, lands that are
+    missing in it or changed since indexing are measured.
+    """
+    entry = get_valid_entry(
+        asset_manifest, "lands", MAIN_PATH, "/".join(("Lands", land_file)))
+    if entry is not None:
+        return entry["max_x"], entry["max_y"]
+    map_obj = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"]
+    return map_obj.dimensions.x / 2, map_obj.dimensions.y / 2
 
-    a = (x - edge_vertices[0].co.x) / l
-    y = a * m + edge_vertices[0].co.y
-    z = a * n + edge_vertices[0].co.z
 
-    try:
-        slope = ((edge_vertices[1].co.y-edge_vertices[0].co.y)/
-                 (edge_vertices[1].co.x-edge_vertices[0].co.x))
-    except ZeroDivisionError:
-        slope = (edge_vertices[1].co.y-edge_vertices[0].co.y)/0.0001
-    angle = math.atan(slope)
+def add_planned_cars(road_sampler, vehicle_index, cars_count=NUMBER_OF_CARS):
+    """
+    Plans the layout of all the cars at once and only then adds the
+    accepted cars to the scene, so no car is added and removed again.
+    Footprints of the added cars are stored in the spatial index.
+    """
+    model_filepaths = get_model_filepaths("Cars")
+    model_bounds = get_model_bounds(model_filepaths)
+    planner_stats = {}
+    layout = plan_vehicle_layout(
+        road_sampler, model_bounds, cars_count, car_colors_weights,
+        stats=planner_stats, cell_size=VEHICLE_INDEX_CELL_SIZE)
+    count("car_collisions", planner_stats["rejected"])
+    if len(layout) < cars_count:
+        print("Only " + str(len(layout)) + " cars fit on the roads!\n")
+
+    for model_id, position, heading, color_id in layout:
+        car_obj = add_vehicle_instance(
+            model_filepaths[model_id], vehicle_name="Car")
+        car_obj.location = position
+        car_obj.rotation_mode = "XYZ"
+        car_obj.rotation_euler = (0, 0, heading)
+        edit_material(car_obj, color_id)
+
+        footprint = get_box_corners(
+            np.array([position]), np.array([heading]),
+            model_bounds[model_id])[0]
+        add_footprint(vehicle_index, footprint.tolist())
+
+    return len(layout)
+
+
+def get_road_sampler(max_x, max_y):
+    """
+    Reads the road edges of the current land once and returns
+    the road sampler clipped to the map extent.
+    """
+    road_mesh = bpy.data.objects["Ways:highway"].data
+    vertices = np.empty(len(road_mesh.vertices) * 3)
+    road_mesh.vertices.foreach_get("co", vertices)
+    edges = np.empty(len(road_mesh.edges) * 2, dtype=np.int32)
+    road_mesh.edges.foreach_get("vertices", edges)
+    return create_road_sampler(vertices, edges, max_x, max_y)
+
 
-    while x > max_x or y > max_y:
-        #   Pick random x value between x values of vertex 1 and vertex 2
-        x = random.uniform(edge_vertices[0].co.x, edge_vertices[1].co.x)
+def edit_material(car_obj, color_choice=None):
+    """
+    Changes the base color of the vehicle. Color is picked
+    randomly if color_choice index is not given.
+    """
+    if color_choice is None:
+        color_choice = np.random.choice(
+            np.arange(0, len(car_colors), 1), p=car_colors_weights)
+    car_material_nodes = car_obj.material_slots[0].material.node_tree.nodes
+    car_material_nodes[0].inputs[0].default_value = car_colors[color_choice]
 
-        l = edge_vertices[1].co.x - edge_vertices[0].co.x
-        m = edge_vertices[1].co.y - edge_vertices[0].co.y
-        n = edge_vertices[1].co.z - edge_vertices[0].co.z
+    car_material_nodes[0].inputs["Metallic"].default_value = 0.65
+    car_material_nodes[0].inputs["Roughness"].default_value = 0.5
+    car_material_nodes[0].inputs["Clearcoat"].default_value = 0.1
 
-        # Avoid division by zero
-        l = 0.1 if l == 0 else l
 
-        a = (x - edge_vertices[0].co.x) / l
-        y = a * m + edge_vertices[0].co.y
-        z = a * n + edge_vertices[0].co.z
+def get_camera_footprint_size(cam_obj, height):
+    """
+    Returns the half width and half height in meters of the ground
+    area seen by the nadir camera at the given height.
+    """
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    scene = bpy.context.scene
+    projection_matrix = cam_obj.calc_matrix_camera(
+        depsgraph, x=scene.render.resolution_x, y=scene.render.resolution_y)
+    return height / projection_matrix[0][0], height / projection_matrix[1][1]
 
-        try:
-            slope = ((edge_vertices[1].co.y-edge_vertices[0].co.y)/
-                     (edge_vertices[1].co.x-edge_vertices[0].co.x))
-        except ZeroDivisionError:
-            slope = (edge_vertices[1].co.y-edge_vertices[0].co.y)/0.0001
-        angle = math.atan(slope)
 
-    return (x, y, z), angle
+@timed
+def decide_camera_locations(coverage_grid, cameras_count=NUMBER_OF_CAMERAS):
+    """
+    Selects random camera locations. Makes sure that
+    road is visible on each position to avoid rendering
+    empty images with no roads and no cars. Locations are drawn
+    directly from the road coverage grid cells where the camera
+    view contains at least MIN_ROAD_COVERAGE meters of road.
+    """
+    return draw_camera_locations(coverage_grid, cameras_count)
 
 
-def get_random_edge_vertices(bm, max_x, max_y):
+def draw_camera_locations(coverage_grid, cameras_count):
     """
-    Selects a radnom road edge and returns the
-    vertices of that edge.
+    Draws camera locations as decide_camera_locations does, without
+    timing them, for stages that are timed themselves.
     """
-    edge = bm.edges[random.randint(0, len(bm.edges)-1)]
+    camera = bpy.data.objects["Camera"]
+    half_width, half_height = get_camera_footprint_size(camera, CAMERA_HEIGHT)
+    camera_cells = get_camera_cells(
+        coverage_grid, half_width, half_height, MIN_ROAD_COVERAGE)
+    return sample_camera_locations(
+        coverage_grid, camera_cells, cameras_count, CAMERA_HEIGHT)
 
-    #   Get edge vertices
-    edge_vertex_1 = edge.verts[0]
-    edge_vertex_2 = edge.verts[1]
 
-    while (
-        (abs(edge_vertex_1.co.x) > max_x or abs(edge_vertex_1.co.y) > max_y) and
-        (abs(edge_vertex_2.co.x) > max_x or abs(edge_vertex_2.co.y) > max_y)):
-        edge = bm.edges[random.randint(0, len(bm.edges)-1)]
+def get_camera_regions(camera_locations, margin=0):
+    """
+    Returns the ground regions (N, 4) (min_x, min_y, max_x, max_y)
+    seen by the nadir cameras at the given locations, grown by the
+    margin in meters.
+    """
+    half_size = np.array(get_camera_footprint_size(
+        bpy.data.objects["Camera"], CAMERA_HEIGHT)) + margin
+    locations = np.array(camera_locations, dtype=float)[:, :2]
+    return np.concatenate((locations - half_size, locations + half_size),
+                          axis=1)
 
-        #   Get edge vertices
-        edge_vertex_1 = edge.verts[0]
-        edge_vertex_2 = edge.verts[1]
 
-    return edge_vertex_1, edge_vertex_2
+@timed
+def get_camera_first_samplers(road_sampler, farmland_sampler,
+                              camera_locations):
+    """
+    Crops the road and farmland samplers to the views of the chosen
+    cameras and their PLACEMENT_MARGIN. Returns the cropped samplers
+    and the number of cars that puts CARS_PER_IMAGE cars into an
+    average image, given that cars are spread uniformly per meter of
+    the cropped roads.
+    """
+    placement_regions = get_camera_regions(camera_locations, PLACEMENT_MARGIN)
+    placement_road_sampler = crop_road_sampler(road_sampler, placement_regions)
+    placement_farmland_sampler = None
+    if farmland_sampler is not None:
+        placement_farmland_sampler = crop_farmland_sampler(
+            farmland_sampler, placement_regions)
+
+    image_road_lengths = [
+        crop_road_sampler(road_sampler, [region])["total_length"]
+        for region in get_camera_regions(camera_locations)]
+    cars_count = round(CARS_PER_IMAGE * placement_road_sampler["total_length"] /
+                       np.mean(image_road_lengths))
+    return placement_road_sampler, placement_farmland_sampler, cars_count
+
+
+def get_vehicle_objects():
+    """
+    Returns all the car objects followed by all the tractor objects,
+    in the order of their bounding boxes.
+    """
+    return (get_car_objects() +
+            [obj for obj in bpy.data.objects if obj.name.startswith("Tractor")])
 
 
-def edit_material(car_obj):
+@timed
+def create_vehicle_bvh(vehicle_objects):
     """
-    Changes the base color of the vehicle.
+    Builds one BVH of the world space triangles of all the vehicles,
+    which is reused by all the cameras of the land. Returns the BVH and
+    the (P,) ids of the vehicles its polygons belong to, which are the
+    vehicle indices in the given list. Returns None without vehicles.
     """
-    color_choice = np.random.choice(
-        np.arange(0, len(car_colors), 1), p=car_colors_weights)
-    car_material_nodes = car_obj.material_slots[0].material.node_tree.nodes
-    car_material_nodes[0].inputs[0].default_value = car_colors[color_choice]
+    # Vehicles of one model share the mesh, it is read only once
+    mesh_triangles = {}
+    all_vertices = []
+    all_triangles = []
+    polygon_vehicle_ids = []
+    vertices_count = 0
+    for vehicle_id, vehicle_obj in enumerate(vehicle_objects):
+        mesh = vehicle_obj.data
+        if mesh.as_pointer() not in mesh_triangles:
+            vertices = np.empty(len(mesh.vertices) * 3)
+            mesh.vertices.foreach_get("co", vertices)
+            mesh.calc_loop_triangles()
+            triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("vertices", triangles)
+            mesh_triangles[mesh.as_pointer()] = (
+                vertices.reshape(-1, 3), triangles.reshape(-1, 3))
+
+        vertices, triangles = mesh_triangles[mesh.as_pointer()]
+        matrix = np.array(vehicle_obj.matrix_world)
+        all_vertices.append(vertices @ matrix[:3, :3].T + matrix[:3, 3])
+        all_triangles.append(triangles + vertices_count)
+        polygon_vehicle_ids.append(np.full(len(triangles), vehicle_id))
+        vertices_count += len(vertices)
+
+    if len(all_triangles) == 0:
+        return None
+    vehicle_bvh = BVHTree.FromPolygons(
+        np.concatenate(all_vertices).tolist(),
+        np.concatenate(all_triangles).tolist())
+    return vehicle_bvh, np.concatenate(polygon_vehicle_ids)
+
+
+def filter_hidden_vehicles(vehicle_bvh, all_vehicle_boxes, indices,
+                           visible_boxes, camera_matrix, first_vehicle_id=0):
+    """
+    Computes the (N, 2) visible and truncated fractions of the vehicles
+    with the given indices and drops the ones with a visible fraction
+    below MIN_VISIBILITY. Returns the kept camera frame boxes and
+    their fractions. Vehicle ids in the BVH start at first_vehicle_id.
+    """
+    bvh, polygon_vehicle_ids = vehicle_bvh
+    visible_fractions, truncated_fractions = compute_visibility(
+        all_vehicle_boxes[indices], indices + first_vehicle_id, camera_matrix,
+        bvh.ray_cast, polygon_vehicle_ids, VISIBILITY_SAMPLES)
+    visibility = np.stack((visible_fractions, truncated_fractions), axis=-1)
 
-    car_material_nodes[0].inputs["Metallic"].default_value = 0.65
-    car_material_nodes[0].inputs["Roughness"].default_value = 0.5
-    car_material_nodes[0].inputs["Clearcoat"].default_value = 0.1
+    kept = visible_fractions >= MIN_VISIBILITY
+    count("hidden_vehicles", int(np.sum(~kept)))
+    return visible_boxes[kept], visibility[kept]
 
 
-def decide_camera_locations(max_x, max_y):
+def count_visible_vehicles(camera_location, all_vehicle_boxes):
     """
-    Selects random camera locations. Makes sure that
-    road is visible on each position to avoid rendering
-    empty images with no roads and no cars.
+    Returns the number of vehicles that would be annotated
+    on the image taken from the given camera location.
     """
-    vertices = bpy.data.objects["Ways:highway"].data.vertices
-    camera = bpy.data.objects["Camera"]
-    scene = bpy.context.scene
-    camera_locations = []
-    # for _ in range(0, NUMBER_OF_CAMERAS):
-    cameras_added = 0
-    while cameras_added < NUMBER_OF_CAMERAS:
-        # Add some space to avoid going out of the map
-
-        random_x_location = random.uniform(-max_x+125, max_x-125)
-        random_y_location = random.uniform(-max_y+72, max_y-72)
-
-        camera.location[0] = random_x_location
-        camera.location[1] = random_y_location
-
-        # camera = bpy.data.objects['Camera']
-        # scene = bpy.context.scene
-        bpy.ops.object.select_all(action="DESELECT")
-        bpy.data.objects["Ways:highway"].select_set(True)
-        bpy.context.view_layer.objects.active = bpy.data.objects["Ways:highway"]
-
-        bpy.ops.object.mode_set(mode="EDIT")
-        bpy.ops.object.mode_set(mode="OBJECT")
-
-        for vert in vertices:
-            co_in_camera = get_co_in_camera_space(scene, camera, vert.co)
-
-            if(co_in_camera[0] >= 0 and co_in_camera[0] <=1 and
-                co_in_camera[1] >= 0 and co_in_camera[1] <=1):
-                cameras_added += 1
-                camera_locations.append(
-                    (random_x_location, random_y_location,
-                    CAMERA_HEIGHT))
+    cam_obj = bpy.data.objects["Camera"]
+    cam_obj.location = camera_location
+    camera_matrix = get_camera_matrix(bpy.context.scene, cam_obj)
+    return len(get_visible_boxes(all_vehicle_boxes, camera_matrix)[0])
+
+
+@timed
+def handle_empty_cameras(camera_locations, coverage_grid, all_vehicle_boxes):
+    """
+    Projects the vehicles before rendering and handles the cameras that
+    would see no vehicle according to EMPTY_CAMERA_POLICY. "keep" renders
+    them anyway, "skip" drops them and "replace" draws new locations,
+    at most MAX_CAMERA_REPLACEMENTS times per camera before dropping it.
+    With CAMERA_FIRST_PLACEMENT there are no vehicles outside of the
+    chosen views, so "replace" drops them too.
+    """
+    if EMPTY_CAMERA_POLICY == "keep":
+        return camera_locations
+
+    kept_locations = []
+    for camera_location in camera_locations:
+        replacements = 0
+        while count_visible_vehicles(camera_location, all_vehicle_boxes) == 0:
+            if (EMPTY_CAMERA_POLICY == "skip" or CAMERA_FIRST_PLACEMENT or
+                replacements == MAX_CAMERA_REPLACEMENTS):
+                camera_location = None
                 break
+            camera_location = draw_camera_locations(coverage_grid, 1)[0]
+            replacements += 1
+            count("camera_replacements")
+
+        if camera_location is not None:
+            kept_locations.append(camera_location)
 
-    return camera_locations
+    count("cameras_skipped", len(camera_locations) - len(kept_locations))
+    if len(kept_locations) < len(camera_locations):
+        print("Skipped " + str(len(camera_locations) - len(kept_locations)) +
+              " cameras with no vehicles!\n")
+    return kept_locations
 
 
 def add_sun():
@@ -344,6 +600,7 @@ def add_sun():
     world.node_tree.nodes["Background"].inputs[1].default_value = 0.9
 
 
+@timed
 def add_shadow_catcher():
     """
     Adds a plane that will be used as a shadow catcher - to
@@ -364,20 +621,62 @@ def add_shadow_catcher():
     # Make it transparent
     bpy.context.scene.render.film_transparent = True
 
-    bpy.ops.render.render()
+    if BACKGROUND_MODE == "view_layer":
+        add_background_view_layer(bpy.data.objects["Plane"])
 
 
+def add_background_view_layer(shadow_catcher_obj):
+    """
+    Adds a view layer that renders the background in the same render
+    call as the vehicles. Shadow catcher is moved to its own collection
+    which is excluded from the background view layer.
+    """
+    scene = bpy.context.scene
+    shadow_catcher_collection = bpy.data.collections.new("Shadow Catcher")
+    scene.collection.children.link(shadow_catcher_collection)
+    for collection in list(shadow_catcher_obj.users_collection):
+        collection.objects.unlink(shadow_catcher_obj)
+    shadow_catcher_collection.objects.link(shadow_catcher_obj)
+
+    background_layer = scene.view_layers.new("Background")
+    background_layer.layer_collection.children[
+        shadow_catcher_collection.name].exclude = True
+
+
+@timed
 def prepare_compositor():
     """
     Set up compositor nodes. Setup containes Alpha Over node to connect shadow
     catcher and the background scene. Also includes nodes to match the car
-    resolution to the rest of the map.
+    resolution to the rest of the map. In the view layer background
+    mode, the background comes from the background view layer instead
+    of the image node. Nodes are created once per loaded land and reused
+    by its next layouts, only the hue and exposure are drawn again.
     """
-    bpy.ops.render.render()
     bpy.context.scene.use_nodes = True
     tree = bpy.context.scene.node_tree
-    render_layers_node = tree.nodes["Render Layers"]
-    composite_node = tree.nodes["Composite"]
+    if not tree.get("dataset_compositor"):
+        create_compositor_nodes(tree)
+
+    # View layers of the previous layout were removed and added again
+    tree.nodes["Render Layers"].layer = bpy.context.view_layer.name
+    if BACKGROUND_MODE == "view_layer":
+        tree.nodes["Background Layer"].layer = "Background"
+    get_compositor_node("HUE_SAT").inputs[2].default_value = \
+        random.uniform(0.9, 1.0) #0.9
+    get_compositor_node("EXPOSURE").inputs[1].default_value = \
+        random.uniform(1.0, 1.3) #1.3
+
+
+def create_compositor_nodes(tree):
+    """
+    Replaces the nodes of the compositor node tree with the nodes
+    that put the rendered vehicles over the background.
+    """
+    tree.nodes.clear()
+    render_layers_node = tree.nodes.new(type="CompositorNodeRLayers")
+    render_layers_node.name = "Render Layers"
+    composite_node = tree.nodes.new(type="CompositorNodeComposite")
     viewer_node = tree.nodes.new(type="CompositorNodeViewer")
     image_node = tree.nodes.new(type="CompositorNodeImage")
     hue_sat_node = tree.nodes.new(type="CompositorNodeHueSat")
@@ -388,8 +687,6 @@ def prepare_compositor():
     scale1_node = tree.nodes.new(type="CompositorNodeScale")
     scale2_node = tree.nodes.new(type="CompositorNodeScale")
     pixelate_node = tree.nodes.new(type="CompositorNodePixelate")
-    hue_sat_node.inputs[2].default_value = random.uniform(0.9, 1.0) #0.9
-    exposure_node.inputs[1].default_value = random.uniform(1.0, 1.3) #1.3
 
     # This blurring and scaling reduce the quality of rendered vehicles
     # so that they would match the limited map resolution
@@ -405,7 +702,12 @@ def prepare_compositor():
     scale2_node.inputs[2].default_value = 1/scale1_node.inputs[2].default_value
 
     links = tree.links
-    links.new(image_node.outputs[0], alpha_over_node.inputs[1])
+    if BACKGROUND_MODE == "view_layer":
+        background_layer_node = tree.nodes.new(type="CompositorNodeRLayers")
+        background_layer_node.name = "Background Layer"
+        links.new(background_layer_node.outputs[0], alpha_over_node.inputs[1])
+    else:
+        links.new(image_node.outputs[0], alpha_over_node.inputs[1])
     links.new(render_layers_node.outputs[0], hue_sat_node.inputs[0])
     links.new(hue_sat_node.outputs[0], exposure_node.inputs[0])
     links.new(exposure_node.outputs[0], blur1_node.inputs[0])
@@ -416,58 +718,294 @@ def prepare_compositor():
     links.new(blur2_node.outputs[0], alpha_over_node.inputs[2])
     links.new(alpha_over_node.outputs[0], composite_node.inputs[0])
     links.new(alpha_over_node.outputs[0], viewer_node.inputs[0])
+    tree["dataset_compositor"] = True
 
 
-def edit_compositor(background_filepath, background_filename):
+def get_compositor_node(node_type):
+    """
+    Returns the first compositor node of the given type.
+    """
+    return [node for node in bpy.context.scene.node_tree.nodes
+            if node.type == node_type][0]
+
+
+def get_appearance():
+    """
+    Returns the sun, compositor and car color settings that the
+    lighting variants change, so they can be set back later.
+    """
+    sun_properties = bpy.context.scene.sun_pos_properties
+    return {
+        "time": sun_properties.time,
+        "month": sun_properties.month,
+        "day": sun_properties.day,
+        "energy": bpy.data.objects["Sun"].data.energy,
+        "saturation": get_compositor_node("HUE_SAT").inputs[2].default_value,
+        "exposure": get_compositor_node("EXPOSURE").inputs[1].default_value,
+        "car_colors": [
+            tuple(get_car_color_input(car_obj).default_value)
+            for car_obj in get_car_objects()]
+    }
+
+
+def get_car_objects():
+    """
+    Returns all the car objects of the scene.
+    """
+    return [obj for obj in bpy.data.objects if obj.name.startswith("Car")]
+
+
+def get_car_color_input(car_obj):
+    """
+    Returns the base color input of the car's own material.
+    """
+    return car_obj.material_slots[0].material.node_tree.nodes[0].inputs[0]
+
+
+def apply_lighting_variant(variant, base_appearance):
+    """
+    Sets the look of the given lighting variant. Variant 0 has the
+    base appearance of the land, the others draw the sun position and
+    energy, the compositor exposure and saturation and, with
+    VARIANT_RECOLOR, new car colors.
+    """
+    scene = bpy.context.scene
+    sun_properties = scene.sun_pos_properties
+    if variant == 0:
+        sun_properties.month = base_appearance["month"]
+        sun_properties.day = base_appearance["day"]
+        sun_properties.time = base_appearance["time"]
+        bpy.data.objects["Sun"].data.energy = base_appearance["energy"]
+        get_compositor_node("HUE_SAT").inputs[2].default_value = \
+            base_appearance["saturation"]
+        get_compositor_node("EXPOSURE").inputs[1].default_value = \
+            base_appearance["exposure"]
+        for car_obj, color in zip(get_car_objects(),
+                                  base_appearance["car_colors"]):
+            get_car_color_input(car_obj).default_value = color
+        return
+
+    sun_properties.month = random.randint(*VARIANT_SUN_MONTHS)
+    # Every month has 28 days
+    sun_properties.day = random.randint(1, 28)
+    sun_properties.time = random.uniform(*VARIANT_SUN_HOURS)
+    bpy.data.objects["Sun"].data.energy = random.uniform(*VARIANT_SUN_ENERGY)
+    get_compositor_node("HUE_SAT").inputs[2].default_value = \
+        random.uniform(*VARIANT_SATURATION)
+    get_compositor_node("EXPOSURE").inputs[1].default_value = \
+        random.uniform(*VARIANT_EXPOSURE)
+    if VARIANT_RECOLOR:
+        for car_obj in get_car_objects():
+            edit_material(car_obj)
+
+
+def edit_compositor(background_filepath):
     """
     Modify render layer node to change background image to
-    the current camera position.
+    the current camera position. One image data block is reloaded
+    for every background, so the backgrounds of the previous
+    cameras are not kept in memory.
     """
     tree = bpy.context.scene.node_tree
     image_node = tree.nodes["Image"]
-    bpy.data.images.load(background_filepath, check_existing=True)
-    image_node.image = bpy.data.images[background_filename]
+    if image_node.image is None:
+        image_node.image = bpy.data.images.load(background_filepath)
+    else:
+        image_node.image.filepath = background_filepath
+        image_node.image.reload()
 
 
-def render_backgrounds(camera_locations):
+def set_render_settings():
     """
-    Render the background image with emission shader before
-    adding the shadow catcher plane.
+    Sets the render engine and the resolution. Must be called before
+    any camera projection, because it depends on the resolution.
     """
-    cam_obj = bpy.data.objects["Camera"]
-
     # Set the render engine to Cycles
     scene = bpy.context.scene
     scene.render.engine = "CYCLES"
     scene.cycles.device = "GPU"
     scene.cycles.samples = RENDER_SAMPLES
-    scene.render.resolution_x, scene.render.resolution_y = render_resolution
+    # One frame covers all the tiles with the meters per pixel of one image
+    scene.render.resolution_x = render_resolution[0] * TILES_PER_AXIS[0]
+    scene.render.resolution_y = render_resolution[1] * TILES_PER_AXIS[1]
+    camera_data = bpy.data.objects["Camera"].data
+    camera_data.sensor_fit = "HORIZONTAL"
+    camera_data.sensor_width = 36 * TILES_PER_AXIS[0]
+    # Keep the scene data and BVH between the renders of one land,
+    # where only the camera moves
+    scene.render.use_persistent_data = True
+
+
+def set_render_border(visible_boxes):
+    """
+    Limits the render to the padded union of the visible vehicle
+    boxes, so only the pixels with vehicles and their shadows are
+    traced. The rest of the frame stays transparent and is filled by
+    the background in the compositor.
+    """
+    render = bpy.context.scene.render
+    # Background view layer must always be rendered whole
+    render.use_border = (CROP_RENDER and len(visible_boxes) > 0 and
+                         BACKGROUND_MODE != "view_layer")
+    if not render.use_border:
+        return
+
+    # Padding also covers the shadows next to the vehicles
+    border_min = np.clip(
+        visible_boxes[:, :2].min(axis=0) - CROP_RENDER_PADDING, 0, 1)
+    border_max = np.clip(
+        visible_boxes[:, 2:].max(axis=0) + CROP_RENDER_PADDING, 0, 1)
+    render.border_min_x, render.border_min_y = border_min
+    render.border_max_x, render.border_max_y = border_max
+    render.use_crop_to_border = False
+
+
+@timed
+def render_backgrounds(camera_locations, orthophoto=None):
+    """
+    Render the background image with emission shader before
+    adding the shadow catcher plane. In the orthophoto background
+    mode the orthophoto returned by get_orthophoto, which is read
+    once per opened land, is cropped directly instead. In the
+    view layer mode backgrounds are rendered with the final images.
+    Recolored lighting variants reuse the backgrounds, so vehicles
+    are hidden from them, otherwise their base colors would show
+    around the blurred vehicles of the variants.
+    """
+    if BACKGROUND_MODE == "view_layer":
+        return
+
+    cam_obj = bpy.data.objects["Camera"]
+    scene = bpy.context.scene
+    hidden_vehicles = []
+    if LIGHTING_VARIANTS > 1 and VARIANT_RECOLOR:
+        hidden_vehicles = get_vehicle_objects()
+    for obj in hidden_vehicles:
+        obj.hide_render = True
+
+    if BACKGROUND_MODE == "orthophoto":
+        texture, plane_bounds, ground_z = orthophoto
 
-    for i in range(0, NUMBER_OF_CAMERAS):
-        curr_index = i + NUMBER_OF_CAMERAS*iteration
+    for i in range(0, len(camera_locations)):
+        curr_index = get_image_index(i)
         cam_obj.location = camera_locations[i]
          # Render background before adding shadows
         background_filename = str(curr_index) + ".png"
         background_filepath = os.path.join(
             DATASET_PATH, "backgrounds", background_filename)
-        scene.render.filepath = background_filepath
-        bpy.ops.render.render(write_still = True)
+
+        if BACKGROUND_MODE == "orthophoto":
+            background = crop_orthophoto(
+                texture, plane_bounds, get_camera_matrix(scene, cam_obj),
+                (scene.render.resolution_x, scene.render.resolution_y),
+                ground_z)
+            save_image_pixels(background, background_filepath)
+            if VERIFY_BACKGROUNDS and i == 0:
+                verify_background(background, background_filepath)
+        else:
+            scene.render.filepath = background_filepath
+            render_scene(write_still = True)
+
+    for obj in hidden_vehicles:
+        obj.hide_render = False
+
+
+def get_orthophoto():
+    """
+    Returns the satellite texture of the map plane as a (rows, columns,
+    channels) array with row 0 at the bottom, the world bounds
+    (min_x, min_y, max_x, max_y) of the plane and its height.
+    """
+    map_obj = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"]
+    image = [node.image for node in map_obj.active_material.node_tree.nodes
+             if node.type == "TEX_IMAGE"][0]
+    pixels = np.empty(
+        image.size[0] * image.size[1] * image.channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    texture = pixels.reshape(image.size[1], image.size[0], image.channels)
+
+    corners = np.array(
+        [(map_obj.matrix_world @ Vector(corner))[:]
+         for corner in map_obj.bound_box])
+    plane_bounds = (
+        corners[:, 0].min(), corners[:, 1].min(),
+        corners[:, 0].max(), corners[:, 1].max())
+    return texture, plane_bounds, corners[:, 2].max()
+
+
+def save_image_pixels(pixels, filepath):
+    """
+    Saves the (rows, columns, channels) image with row 0
+    at the top as a png file.
+    """
+    rows, columns, channels = pixels.shape
+    rgba = np.ones((rows, columns, 4), dtype=np.float32)
+    rgba[..., :min(channels, 4)] = pixels[..., :4]
+
+    image = bpy.data.images.new(
+        "Background Crop", width=columns, height=rows, alpha=True)
+    # Blender image pixels start at the bottom row
+    image.pixels.foreach_set(np.flipud(rgba).ravel())
+    image.filepath_raw = filepath
+    image.file_format = "PNG"
+    image.save()
+    bpy.data.images.remove(image)
+
+
+def load_image_pixels(filepath):
+    """
+    Loads the image file as a (rows, columns, 4) array
+    with row 0 at the top.
+    """
+    image = bpy.data.images.load(filepath)
+    pixels = np.empty(image.size[0] * image.size[1] * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    bpy.data.images.remove(image)
+    return np.flipud(pixels.reshape(image.size[1], image.size[0], 4))
 
 
-def get_co_in_camera_space(scene, obj, co):
+def verify_background(background, background_filepath):
     """
-    Transforms coordinates in the world space to
-    the camera space.
+    Renders the same background with Cycles and prints the pixel
+    difference to the cropped orthophoto. Vehicles are hidden during
+    the check render, because the crop contains only the map.
     """
-    co_2d = bpy_extras.object_utils.world_to_camera_view(scene, obj, co)
-    return co_2d
+    scene = bpy.context.scene
+    vehicles = [obj for obj in scene.objects
+                if obj.name.startswith("Car") or obj.name.startswith("Tractor")]
+    for obj in vehicles:
+        obj.hide_render = True
+
+    cycles_filepath = background_filepath[:-4] + "_cycles.png"
+    scene.render.filepath = cycles_filepath
+    render_scene(write_still = True)
+    for obj in vehicles:
+        obj.hide_render = False
+
+    mean_difference, max_difference = get_pixel_difference(
+        background[..., :3], load_image_pixels(cycles_filepath)[..., :3])
+    os.remove(cycles_filepath)
+    print("Orthophoto background difference to Cycles: mean " +
+          str(round(mean_difference, 4)) + ", max " +
+          str(round(max_difference, 4)) + "\n")
+    if mean_difference > MAX_BACKGROUND_DIFFERENCE:
+        print("Orthophoto background differs from the Cycles render!\n")
 
 
 def render_images_with_annotations(
-    data, camera_locations, all_car_boxes, all_tractor_boxes):
+    coco_sink, camera_locations, all_car_boxes, all_tractor_boxes,
+    shard_writer=None, output_writer=None, vehicle_bvh=None):
     """
     Renders the final image of the car with its shadow.
-    Saves the annotations for each rendered image.
+    Saves the annotations for each rendered image. Vehicle
+    boxes are given as (N, 4, 3) arrays. If the shard writer is
+    given, images and labels are written into tar shards. If the
+    output writer is given, they are written by its threads. If the
+    vehicle BVH is given, visibility of the vehicles is annotated too.
+    With TILE_RENDER every camera renders one frame that is sliced
+    into TILES_COUNT annotated images. With LIGHTING_VARIANTS every
+    camera renders that many frames with a different look, which
+    share the annotations.
     """
     prepare_compositor()
 
@@ -476,189 +1014,438 @@ def render_images_with_annotations(
 
     global iteration
 
-    for cam_index in range(0, NUMBER_OF_CAMERAS):
+    # Tiles are cut from the composited pixels, so they are encoded here
+    uses_pixels = output_writer is not None or TILE_RENDER
+    image_extension = IMAGE_FORMAT if uses_pixels else "png"
 
-        curr_index = cam_index + NUMBER_OF_CAMERAS*iteration
+    if LIGHTING_VARIANTS > 1:
+        base_appearance = get_appearance()
 
-        data["images"].append({
-        "id": curr_index,
-        "file_name": "images/" + str(curr_index) + ".png",
-        "width": render_resolution[0],
-        "height": render_resolution[1]
-        })
+    for cam_index in range(0, len(camera_locations)):
 
+        background_filename = str(get_image_index(cam_index)) + ".png"
         cam_obj.location = camera_locations[cam_index]
-        image_filename = str(curr_index) + ".png"
-        image_filepath = os.path.join(DATASET_PATH, "images", image_filename)
-        scene.render.filepath = image_filepath
         background_filepath = os.path.join(
-            DATASET_PATH, "backgrounds", image_filename)
-        edit_compositor(background_filepath, image_filename)
-        bpy.ops.render.render(write_still = True)
-
-        annotate_vehicle_coco(
-            data, all_car_boxes, scene, cam_obj, curr_index, "car")
-        if ADD_TRACTORS:
-            annotate_vehicle_coco(
-                data, all_tractor_boxes, scene, cam_obj, curr_index, "tractor")
-
-        # Clear the file if it already exists
-        with open(os.path.join(
-            DATASET_PATH, "labels", str(curr_index) + ".txt"),
-            "w", encoding="utf-8"):
-            pass
-
-        annotate_vehicles_yolo(
-            all_car_boxes, scene, cam_obj, curr_index, "car")
-        if ADD_TRACTORS:
-            annotate_vehicles_yolo(
-                all_tractor_boxes, scene, cam_obj, curr_index, "tractor")
-
+            DATASET_PATH, "backgrounds", background_filename)
+        if BACKGROUND_MODE != "view_layer":
+            edit_compositor(background_filepath)
+
+        # The border covers the vehicles of all the tiles of the frame
+        camera_matrix = get_camera_matrix(scene, cam_obj)
+        car_boxes = get_visible_boxes(all_car_boxes, camera_matrix)[1]
+        tractor_boxes = get_visible_boxes(all_tractor_boxes, camera_matrix)[1]
+
+        # Hidden vehicles are still rendered, so they are inside the border
+        set_render_border(np.concatenate((car_boxes, tractor_boxes)))
+
+        # Geometry does not change between the variants, so the vehicles
+        # of every tile are projected only once
+        tiles_vehicles = [
+            get_tile_vehicles(
+                get_tile_matrix(camera_matrix, TILES_PER_AXIS, tile_index),
+                all_car_boxes, all_tractor_boxes, vehicle_bvh)
+            for tile_index in range(0, TILES_COUNT)]
+
+        for variant in range(0, LIGHTING_VARIANTS):
+            if LIGHTING_VARIANTS > 1:
+                apply_lighting_variant(variant, base_appearance)
+            scene.render.filepath = os.path.join(
+                DATASET_PATH, "images",
+                str(get_image_index(cam_index, variant=variant)) + ".png")
+            with timed_stage("final_render"):
+                render_scene(write_still = not uses_pixels)
+            pixels = get_viewer_pixels() if uses_pixels else None
+
+            for tile_index in range(0, TILES_COUNT):
+                curr_index = get_image_index(
+                    cam_index, tile_index=tile_index, variant=variant)
+                image_filename = str(curr_index) + "." + image_extension
+                image_filepath = os.path.join(
+                    DATASET_PATH, "images", image_filename)
+
+                coco_image = {
+                "id": curr_index,
+                "file_name": (image_filename if shard_writer is not None
+                              else "images/" + image_filename),
+                "width": render_resolution[0],
+                "height": render_resolution[1]
+                }
+                add_coco_image(coco_sink, coco_image)
+
+                (car_boxes, car_visibility,
+                 tractor_boxes, tractor_visibility) = tiles_vehicles[tile_index]
+                with timed_stage("annotation"):
+                    coco_annotations = annotate_vehicle_coco(
+                        coco_sink, car_boxes, scene, curr_index, "car",
+                        car_visibility)
+                    if ADD_TRACTORS:
+                        coco_annotations += annotate_vehicle_coco(
+                            coco_sink, tractor_boxes, scene, curr_index,
+                            "tractor", tractor_visibility)
+
+                    label_lines = annotate_vehicles_yolo(
+                        car_boxes, "car", car_visibility)
+                    if ADD_TRACTORS:
+                        label_lines += annotate_vehicles_yolo(
+                            tractor_boxes, "tractor", tractor_visibility)
+
+                if output_writer is not None:
+                    # Waiting here means the disk is slower than the renders
+                    with timed_stage("output_submit"):
+                        submit_output(
+                            output_writer, write_image_outputs, output_writer,
+                            shard_writer,
+                            get_tile_pixels(pixels, TILES_PER_AXIS, tile_index),
+                            curr_index, image_filepath, label_lines,
+                            coco_image, coco_annotations)
+                elif uses_pixels:
+                    with timed_stage("image_writing"):
+                        write_image_outputs(
+                            None, shard_writer,
+                            get_tile_pixels(pixels, TILES_PER_AXIS, tile_index),
+                            curr_index, image_filepath, label_lines,
+                            coco_image, coco_annotations)
+                elif shard_writer is not None:
+                    with timed_stage("shard_writing"):
+                        with open(image_filepath, "rb") as f:
+                            image_bytes = f.read()
+                        write_shard_sample(
+                            shard_writer, curr_index, "png", image_bytes,
+                            label_lines, coco_image, coco_annotations)
+                        os.remove(image_filepath)
+                else:
+                    write_yolo_labels(
+                        os.path.join(DATASET_PATH, "labels"), curr_index,
+                        label_lines)
+        if DELETE_BACKGROUNDS and BACKGROUND_MODE != "view_layer":
+            os.remove(background_filepath)
+
+    flush_coco_sink(coco_sink)
     iteration += 1
 
 
-def annotate_vehicles_yolo(
-    all_vehicle_boxes, scene, cam_obj, curr_index, vehicle_type):
+def get_tile_vehicles(tile_matrix, all_car_boxes, all_tractor_boxes,
+                      vehicle_bvh=None):
     """
-    Write yolo annotations of cars.
+    Returns the clamped camera frame boxes of the cars and tractors
+    seen by the tile with the given camera matrix, each followed by
+    their (N, 2) visible and truncated fractions if the vehicle BVH
+    is given, or None.
     """
-    for box in all_vehicle_boxes:
-        out_of_the_image = 0
-        for point in box:
-            point_co_in_camera = get_co_in_camera_space(scene, cam_obj, point)
+    car_indices, car_boxes = get_visible_boxes(all_car_boxes, tile_matrix)
+    tractor_indices, tractor_boxes = get_visible_boxes(
+        all_tractor_boxes, tile_matrix)
+
+    car_visibility = tractor_visibility = None
+    if vehicle_bvh is not None:
+        with timed_stage("visibility"):
+            car_boxes, car_visibility = filter_hidden_vehicles(
+                vehicle_bvh, all_car_boxes, car_indices, car_boxes,
+                tile_matrix)
+            tractor_boxes, tractor_visibility = filter_hidden_vehicles(
+                vehicle_bvh, all_tractor_boxes, tractor_indices,
+                tractor_boxes, tile_matrix, len(all_car_boxes))
+    return car_boxes, car_visibility, tractor_boxes, tractor_visibility
+
+
+def write_shard_sample(shard_writer, image_index, image_extension, image_bytes,
+                       label_lines, coco_image, coco_annotations):
+    """
+    Writes the encoded image together with its yolo label lines and
+    coco records into the current tar shard.
+    """
+    add_shard_sample(shard_writer, image_index, {
+        image_extension: image_bytes,
+        "txt": "".join(label_lines).encode("utf-8"),
+        "json": json.dumps({
+            "image": coco_image,
+            "annotations": coco_annotations}).encode("utf-8")
+    })
 
-            if((point_co_in_camera[0] > 1 or point_co_in_camera[0] < 0) or
-                (point_co_in_camera[1] > 1 or point_co_in_camera[1] < 0)):
-                out_of_the_image += 1
-        # All four points must be out of the image to ignore the car
-        if out_of_the_image == 4:
-            print("Out of the image!\n")
-        else:
-            box_x_coordinates = []
-            box_y_coordinates = []
-            for point in box:
-                point_co_in_camera = get_co_in_camera_space(
-                    scene, cam_obj, point)
 
-                if point_co_in_camera[0] > 1:
-                    point_co_in_camera[0] = 1
-                if point_co_in_camera[0] < 0:
-                    point_co_in_camera[0] = 0
-                if point_co_in_camera[1] > 1:
-                    point_co_in_camera[1] = 1
-                if point_co_in_camera[1] < 0:
-                    point_co_in_camera[1] = 0
+def get_viewer_pixels():
+    """
+    Returns a copy of the composited image of the last render as a
+    linear (rows, columns, 4) array with row 0 at the bottom. Composite
+    is read from the viewer node, because the pixels of the render
+    result are not accessible from Python.
+    """
+    viewer_image = bpy.data.images["Viewer Node"]
+    columns, rows = viewer_image.size
+    pixels = np.empty(rows * columns * 4, dtype=np.float32)
+    viewer_image.pixels.foreach_get(pixels)
+    return pixels.reshape(rows, columns, 4)
 
-                box_x_coordinates.append(point_co_in_camera[0])
-                box_y_coordinates.append(point_co_in_camera[1])
 
-            bounding_box = return_yolo_box(box_x_coordinates, box_y_coordinates)
+def get_tile_pixels(pixels, tiles_per_axis, tile_index):
+    """
+    Returns the pixels of one tile of the (rows, columns, 4) frame with
+    row 0 at the bottom. Tiles are counted row by row from the top left.
+    """
+    tile_rows = pixels.shape[0] // tiles_per_axis[1]
+    tile_columns = pixels.shape[1] // tiles_per_axis[0]
+    column = tile_index % tiles_per_axis[0]
+    row = tiles_per_axis[1] - 1 - tile_index // tiles_per_axis[0]
+    return pixels[row * tile_rows:(row + 1) * tile_rows,
+                  column * tile_columns:(column + 1) * tile_columns]
 
-            category_id = ALL_VEHICLES.index(vehicle_type)
 
-            with open(os.path.join(
-                DATASET_PATH, "labels", str(curr_index) + ".txt"), "a",
-                encoding="utf-8") as f:
-                f.write(str(category_id) + " " +
-                    str(bounding_box[0]) + " " + str(bounding_box[1]) + " " +
-                    str(bounding_box[2]) + " " + str(bounding_box[3]) + "\n")
+def write_image_outputs(output_writer, shard_writer, pixels, image_index,
+                        image_filepath, label_lines, coco_image,
+                        coco_annotations):
+    """
+    Encodes the image and writes it with its labels, either to their
+    own files or into the tar shard. Runs in the output writer threads
+    if the output writer is given, so it must not use bpy.
+    """
+    image_bytes = encode_image(pixels, IMAGE_FORMAT, IMAGE_COMPRESSION)
+    if shard_writer is not None and output_writer is not None:
+        with output_writer["lock"]:
+            write_shard_sample(
+                shard_writer, image_index, IMAGE_FORMAT, image_bytes,
+                label_lines, coco_image, coco_annotations)
+    elif shard_writer is not None:
+        write_shard_sample(
+            shard_writer, image_index, IMAGE_FORMAT, image_bytes,
+            label_lines, coco_image, coco_annotations)
+    else:
+        write_file(image_filepath, image_bytes)
+        write_yolo_labels(
+            os.path.join(DATASET_PATH, "labels"), image_index, label_lines)
+
+
+def annotate_vehicles_yolo(visible_boxes, vehicle_type, visibility=None):
+    """
+    Returns yolo annotation lines of vehicles. Takes the clamped
+    camera frame boxes of the visible vehicles and optionally their
+    (N, 2) visible and truncated fractions, which are appended to the
+    lines if YOLO_VISIBILITY is set.
+    """
+    category_id = ALL_VEHICLES.index(vehicle_type)
+
+    label_lines = []
+    for k, bounding_box in enumerate(return_yolo_boxes(visible_boxes)):
+        label_line = (str(category_id) + " " +
+            str(float(bounding_box[0])) + " " +
+            str(float(bounding_box[1])) + " " +
+            str(float(bounding_box[2])) + " " +
+            str(float(bounding_box[3])))
+        if YOLO_VISIBILITY and visibility is not None:
+            label_line += (" " + str(float(visibility[k, 0])) +
+                           " " + str(float(visibility[k, 1])))
+        label_lines.append(label_line + "\n")
+    return label_lines
 
 
 def annotate_vehicle_coco(
-        data, all_vehicle_boxes, scene, cam_obj, cam_index, vehicle_type):
+        coco_sink, visible_boxes, scene, cam_index, vehicle_type,
+        visibility=None):
     """
-    Write coco annotations of cars.
+    Write coco annotations of vehicles to the coco sink and returns
+    them. Takes the clamped camera frame boxes of the visible vehicles
+    and optionally their (N, 2) visible and truncated fractions.
     """
-    for box in all_vehicle_boxes:
-        out_of_the_image = 0
-        for point in box:
-            point_co_in_camera = get_co_in_camera_space(scene, cam_obj, point)
+    category_id = ALL_VEHICLES.index(vehicle_type)
 
-            if((point_co_in_camera[0] > 1 or point_co_in_camera[0] < 0) or
-                (point_co_in_camera[1] > 1 or point_co_in_camera[1] < 0)):
-                out_of_the_image += 1
-        # All four points must be out of the image to ignore the car
-        if out_of_the_image == 4:
-            print("Out of the image!\n")
-        else:
-            box_x_coordinates = []
-            box_y_coordinates = []
-            for point in box:
-                point_co_in_camera = get_co_in_camera_space(
-                    scene, cam_obj, point)
-
-                if point_co_in_camera[0] > 1:
-                    point_co_in_camera[0] = 1
-                if point_co_in_camera[0] < 0:
-                    point_co_in_camera[0] = 0
-                if point_co_in_camera[1] > 1:
-                    point_co_in_camera[1] = 1
-                if point_co_in_camera[1] < 0:
-                    point_co_in_camera[1] = 0
-
-                box_x_coordinates.append(point_co_in_camera[0])
-                box_y_coordinates.append(point_co_in_camera[1])
-
-            bounding_box = return_coco_box(
-                box_x_coordinates, box_y_coordinates, scene)
-            category_id = ALL_VEHICLES.index(vehicle_type)
-            data = create_coco(data, cam_index, category_id, bounding_box)
+    annotations = []
+    for k, bounding_box in enumerate(
+            return_coco_boxes(visible_boxes, scene, render_resolution)):
+        annotations.append(create_coco(
+            get_next_annotation_id(coco_sink), cam_index, category_id,
+            [int(v) for v in bounding_box]))
+        if visibility is not None:
+            annotations[-1]["visibility"] = float(visibility[k, 0])
+            annotations[-1]["truncation"] = float(visibility[k, 1])
+        add_coco_annotation(coco_sink, annotations[-1])
+    return annotations
 
 
 def main():
     """
     Main function that creates the dataset.
     """
+    global iteration
+
     # Create yolo labels folder if it does not exist
-    if not os.path.exists(os.path.join(DATASET_PATH, "labels")):
+    if OUTPUT_FORMAT == "files" and \
+        not os.path.exists(os.path.join(DATASET_PATH, "labels")):
         os.makedirs(os.path.join(DATASET_PATH, "labels"))
 
-    # Transform color space to standard to keep the map color same as original
-    bpy.context.scene.view_settings.view_transform = "Standard"
+    manifest_filepath = os.path.join(DATASET_PATH, "run_manifest.json")
+    manifest = load_run_manifest(manifest_filepath) if RESUME else None
+    if manifest is None:
+        manifest = create_run_manifest()
+    else:
+        print("Resuming the run from land " +
+              str(manifest["next_iteration"]) + "\n")
+        set_random_states(manifest)
+    if SEED is not None and manifest["random_state"] is None:
+        random.seed(SEED)
+        np.random.seed(SEED)
+    iteration = manifest["next_iteration"]
+    if manifest.get("land_schedule") is None:
+        manifest["land_schedule"] = schedule_lands(LANDS_COUNT)
+    set_vehicle_library(VEHICLE_LIBRARY_PATH, LINK_VEHICLE_LIBRARY)
 
     data = {
         "description": {"year":2023},
         "licenses": [],
         "categories": [
             {"id": 0, "name": "car"},
-            {"id": 1, "name": "tractors"}],
-        "images": [],
-        "annotations": []
+            {"id": 1, "name": "tractors"}]
         }
-
-    for _ in range(0, LANDS_COUNT):
-        import_map_and_roads()
-
-        max_x = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"].dimensions.x / 2
-        max_y = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"].dimensions.y / 2
-
-        car_count = 0
-        while car_count < NUMBER_OF_CARS:
-            cars_added = add_new_car(max_x, max_y)
-            car_count += cars_added
-
-        if ADD_TRACTORS:
-            add_farm_vehicles(max_x, max_y)
-
-        bpy.ops.object.camera_add(location=(0, 0, CAMERA_HEIGHT))
-        bpy.data.scenes["Scene"].camera = bpy.data.objects["Camera"]
-
-        camera_locations = decide_camera_locations(max_x, max_y)
-
-        add_sun()
-        render_backgrounds(camera_locations)
-        add_shadow_catcher()
-
-        all_car_boxes = get_all_cars_bounding_boxes()
-        all_tractor_boxes = get_all_tractors_bounding_boxes()
-        render_images_with_annotations(
-            data, camera_locations, all_car_boxes, all_tractor_boxes)
-
-    filename = os.path.join(DATASET_PATH, "label.json")
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f)
-
-    bpy.ops.wm.save_as_mainfile(filepath = MAIN_PATH + "test.blend")
+    # Drop coco records of the work that was not finished
+    truncate_coco_parts(
+        os.path.join(DATASET_PATH, "label_parts"),
+        manifest["coco_part_index"], manifest["coco_part_size"])
+    coco_sink = create_coco_sink(
+        os.path.join(DATASET_PATH, "label_parts"), COCO_IMAGES_PER_PART,
+        manifest["next_annotation_id"], manifest["coco_part_index"],
+        manifest["coco_images_in_part"])
+    shard_writer = None
+    if OUTPUT_FORMAT == "tar_shards":
+        shard_writer = create_shard_writer(
+            os.path.join(DATASET_PATH, "shards"), SAMPLES_PER_SHARD,
+            manifest.get("shard_index", 0), manifest.get("shard_size", 0),
+            manifest.get("samples_in_shard", 0),
+            manifest.get("shard_index_size", 0))
+
+    output_writer = None
+    if ASYNC_OUTPUT:
+        output_writer = create_output_writer(
+            OUTPUT_WORKERS, MAX_PENDING_OUTPUTS)
+    # Images encoded in Python are not written by Blender, which would
+    # create the folder
+    if (ASYNC_OUTPUT or TILE_RENDER) and OUTPUT_FORMAT == "files" and \
+        not os.path.exists(os.path.join(DATASET_PATH, "images")):
+        os.makedirs(os.path.join(DATASET_PATH, "images"))
+    # Orthophoto crops are saved from Python and read back by the
+    # compositor, so the folder must exist before the first one
+    if BACKGROUND_MODE != "view_layer":
+        os.makedirs(os.path.join(DATASET_PATH, "backgrounds"), exist_ok=True)
+
+    restart_worker = False
+    try:
+        loaded_land_file = None
+        for _ in range(iteration, LANDS_COUNT):
+            start_land(iteration)
+            land_file = manifest["land_schedule"][iteration]
+            if land_file == loaded_land_file:
+                clear_scene_layout()
+                # Opening another land frees all the data blocks anyway
+                if MEMORY_BOUNDED:
+                    purge_orphan_data()
+            else:
+                import_map_and_roads(land_file)
+                loaded_land_file = land_file
+
+                max_x, max_y = get_land_extent(land_file)
+                road_sampler = get_road_sampler(max_x, max_y)
+                coverage_grid = create_road_coverage_grid(
+                    road_sampler, max_x, max_y, ROAD_COVERAGE_CELL_SIZE)
+                farmland_sampler = (get_farmland_sampler(max_x, max_y)
+                                    if ADD_TRACTORS else None)
+                # Satellite texture is the same for all layouts of the land
+                orthophoto = (get_orthophoto()
+                              if BACKGROUND_MODE == "orthophoto" else None)
+
+            bpy.ops.object.camera_add(location=(0, 0, CAMERA_HEIGHT))
+            bpy.data.scenes["Scene"].camera = bpy.data.objects["Camera"]
+            set_render_settings()
+
+            cars_count = NUMBER_OF_CARS
+            placement_road_sampler = road_sampler
+            placement_farmland_sampler = farmland_sampler
+            if CAMERA_FIRST_PLACEMENT:
+                camera_locations = decide_camera_locations(coverage_grid)
+                (placement_road_sampler, placement_farmland_sampler,
+                 cars_count) = get_camera_first_samplers(
+                    road_sampler, farmland_sampler, camera_locations)
+
+            vehicle_index = create_spatial_index(VEHICLE_INDEX_CELL_SIZE)
+
+            with timed_stage("car_placement"):
+                if BATCH_PLACEMENT:
+                    add_planned_cars(
+                        placement_road_sampler, vehicle_index, cars_count)
+                else:
+                    car_count = 0
+                    while car_count < cars_count:
+                        cars_added = add_new_car(
+                            placement_road_sampler, vehicle_index)
+                        car_count += cars_added
+
+            if ADD_TRACTORS:
+                add_farm_vehicles(
+                    placement_road_sampler, placement_farmland_sampler,
+                    vehicle_index, cars_count)
+
+            print_cache_stats()
+
+            if not CAMERA_FIRST_PLACEMENT:
+                camera_locations = decide_camera_locations(coverage_grid)
+
+            # Update world matrices of all the placed vehicles
+            bpy.context.view_layer.update()
+            all_car_boxes = get_boxes_array(get_all_cars_bounding_boxes())
+            all_tractor_boxes = get_boxes_array(get_all_tractors_bounding_boxes())
+            camera_locations = handle_empty_cameras(
+                camera_locations, coverage_grid,
+                np.concatenate((all_car_boxes, all_tractor_boxes)))
+
+            add_sun()
+            render_backgrounds(camera_locations, orthophoto)
+            add_shadow_catcher()
+
+            vehicle_bvh = (create_vehicle_bvh(get_vehicle_objects())
+                           if COMPUTE_VISIBILITY else None)
+            render_images_with_annotations(
+                coco_sink, camera_locations, all_car_boxes, all_tractor_boxes,
+                shard_writer, output_writer, vehicle_bvh)
+
+            # Manifest must not record images that are not written yet
+            if output_writer is not None:
+                flush_output_writer(output_writer)
+            # Iteration was already increased by render_images_with_annotations
+            record_finished_land(
+                manifest, iteration - 1, land_file, camera_locations,
+                [get_image_index(cam_index, iteration - 1, tile_index, variant)
+                 for cam_index in range(0, len(camera_locations))
+                 for variant in range(0, LIGHTING_VARIANTS)
+                 for tile_index in range(0, TILES_COUNT)],
+                coco_sink, shard_writer)
+            save_run_manifest(manifest, manifest_filepath)
+            record_memory(get_data_blocks_counts())
+            finish_land(
+                os.path.join(DATASET_PATH, "performance.jsonl"),
+                len(camera_locations) * IMAGES_PER_CAMERA)
+
+            # The manifest was just saved, so a new process resumes here
+            memory_usage = get_memory_usage()
+            if (MEMORY_BOUNDED and memory_usage is not None and
+                memory_usage > MAX_WORKER_MEMORY_MB * 1024**2 and
+                iteration < LANDS_COUNT):
+                print("Worker uses " + str(memory_usage // 1024**2) +
+                      " MB of memory, stopping it to resume in a new " +
+                      "process\n")
+                restart_worker = True
+                break
+    finally:
+        # Images that were already rendered are written even after a crash
+        if output_writer is not None:
+            close_output_writer(output_writer)
+
+    if restart_worker:
+        sys.exit(RESTART_EXIT_CODE)
+
+    flush_coco_sink(coco_sink)
+    merge_coco_parts(
+        os.path.join(DATASET_PATH, "label_parts"),
+        os.path.join(DATASET_PATH, "label.json"), data)
+
+    # Saved per dataset folder so parallel workers do not overwrite it
+    bpy.ops.wm.save_as_mainfile(
+        filepath = os.path.join(DATASET_PATH, "test.blend"))
 
 
 if __name__ == "__main__":
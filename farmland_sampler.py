@@ -0,0 +1,124 @@
+import numpy as np
+
+
+def create_farmland_sampler(vertices, triangles, max_x, max_y):
+    """
+    Builds the farmland sampler from the farmland mesh vertices (V, 3)
+    and triangles (T, 3). Triangles of all the farmland fields are kept
+    together, so fields made of several separate parts are handled as
+    one multipolygon. Triangles outside of the map extent are dropped
+    and a cumulative area table is stored so that points are sampled
+    uniformly per square meter of farmland. Returns None if there is
+    no farmland inside the extent.
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)[:, :2]
+    triangles = np.asarray(triangles, dtype=int).reshape(-1, 3)
+    corners = vertices[triangles]
+
+    inside = ((corners[:, :, 0].max(axis=1) > -max_x) &
+              (corners[:, :, 0].min(axis=1) < max_x) &
+              (corners[:, :, 1].max(axis=1) > -max_y) &
+              (corners[:, :, 1].min(axis=1) < max_y))
+    corners = corners[inside]
+    edge_a = corners[:, 1] - corners[:, 0]
+    edge_b = corners[:, 2] - corners[:, 0]
+    areas = np.abs(edge_a[:, 0] * edge_b[:, 1] - edge_a[:, 1] * edge_b[:, 0]) / 2
+    keep = areas > 0
+
+    if not np.any(keep):
+        return None
+
+    return {
+        "origins": corners[keep, 0],
+        "edges_a": edge_a[keep],
+        "edges_b": edge_b[keep],
+        "cumulative_areas": np.cumsum(areas[keep]),
+        "total_area": float(np.sum(areas[keep])),
+        "max_x": max_x,
+        "max_y": max_y
+    }
+
+
+def crop_farmland_sampler(farmland_sampler, regions):
+    """
+    Returns the farmland sampler that only samples points inside the
+    union of the rectangle regions (R, 4) (min_x, min_y, max_x, max_y),
+    or None if no farmland reaches them. Triangles outside of all the
+    regions are dropped, points of the others are rejected when
+    sampled outside of the regions.
+    """
+    regions = np.asarray(regions, dtype=float).reshape(-1, 4)
+    origins = farmland_sampler["origins"]
+    corners = np.stack((origins, origins + farmland_sampler["edges_a"],
+                        origins + farmland_sampler["edges_b"]), axis=1)
+    low, high = corners.min(axis=1), corners.max(axis=1)
+    inside = np.any(
+        (high[:, None, 0] > regions[:, 0]) & (low[:, None, 0] < regions[:, 2]) &
+        (high[:, None, 1] > regions[:, 1]) & (low[:, None, 1] < regions[:, 3]),
+        axis=1)
+
+    if not np.any(inside):
+        return None
+
+    areas = np.diff(farmland_sampler["cumulative_areas"], prepend=0)[inside]
+    return dict(farmland_sampler, **{
+        "origins": origins[inside],
+        "edges_a": farmland_sampler["edges_a"][inside],
+        "edges_b": farmland_sampler["edges_b"][inside],
+        "cumulative_areas": np.cumsum(areas),
+        "total_area": float(np.sum(areas)),
+        "regions": regions
+    })
+
+
+def sample_triangle_points(farmland_sampler, n, rng=np.random):
+    """
+    Returns n points (n, 2) distributed uniformly over the
+    farmland triangles.
+    """
+    areas = rng.uniform(0, farmland_sampler["total_area"], n)
+    triangles = np.searchsorted(
+        farmland_sampler["cumulative_areas"], areas, side="right")
+    triangles = np.minimum(triangles, len(farmland_sampler["origins"]) - 1)
+
+    # Points of the parallelogram that fall out of the triangle
+    # are mirrored back into it
+    u = rng.uniform(0, 1, n)
+    v = rng.uniform(0, 1, n)
+    outside = u + v > 1
+    u[outside], v[outside] = 1 - u[outside], 1 - v[outside]
+
+    return (farmland_sampler["origins"][triangles] +
+            u[:, None] * farmland_sampler["edges_a"][triangles] +
+            v[:, None] * farmland_sampler["edges_b"][triangles])
+
+
+def sample_farmland_points(farmland_sampler, n, rng=np.random, max_rounds=20):
+    """
+    Returns n random points (n, 2) on the farmland inside the map
+    extent, and inside its regions if the sampler was cropped. Points
+    of the triangles that cross the border are drawn again until there
+    are n points, fewer points are returned only if almost all the
+    farmland is outside.
+    """
+    points = np.empty((0, 2))
+    acceptance = 0.5
+    for _ in range(0, max_rounds):
+        missing = n - len(points)
+        if missing <= 0:
+            break
+        # Draws more candidates when few of the previous ones were inside
+        candidates = sample_triangle_points(
+            farmland_sampler, int(missing / max(acceptance, 0.01)) + 1, rng)
+        inside = ((np.abs(candidates[:, 0]) < farmland_sampler["max_x"]) &
+                  (np.abs(candidates[:, 1]) < farmland_sampler["max_y"]))
+        if "regions" in farmland_sampler:
+            regions = farmland_sampler["regions"]
+            inside &= np.any(
+                (candidates[:, None, 0] >= regions[:, 0]) &
+                (candidates[:, None, 0] <= regions[:, 2]) &
+                (candidates[:, None, 1] >= regions[:, 1]) &
+                (candidates[:, None, 1] <= regions[:, 3]), axis=1)
+        acceptance = max(np.mean(inside), acceptance / 4)
+        points = np.concatenate((points, candidates[inside][:missing]))
+    return points
@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import time
+
+import bpy
+
+sys.path.append(os.path.dirname(__file__))
+from asset_manifest import (
+    get_asset_files, get_file_stamp, get_valid_entry, load_asset_manifest,
+    save_asset_manifest)
+from vehicle_cache import get_template_footprint
+
+
+VEHICLE_FOLDERS = [("Cars", "car"), ("Tractors", "tractor")]
+
+
+def index_vehicle(main_path, relative_path, vehicle_class, use_hash):
+    """
+    Imports the vehicle model into an empty scene and returns
+    its manifest entry.
+    """
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    start_time = time.perf_counter()
+    bpy.ops.import_scene.fbx(filepath = os.path.join(main_path, relative_path))
+    import_time = time.perf_counter() - start_time
+    vehicle_obj = bpy.context.selected_objects[0]
+
+    entry = get_file_stamp(os.path.join(main_path, relative_path), use_hash)
+    entry.update({
+        "class": vehicle_class,
+        "object_name": vehicle_obj.name,
+        "bound_box": [list(corner) for corner in vehicle_obj.bound_box],
+        "scale": list(vehicle_obj.scale),
+        "footprint": list(get_template_footprint(vehicle_obj)),
+        "material_slots": [slot.material.name if slot.material else None
+                           for slot in vehicle_obj.material_slots],
+        "import_time": import_time
+    })
+    return entry
+
+
+def index_land(main_path, relative_path, use_hash):
+    """
+    Opens the land file and returns its manifest entry.
+    """
+    bpy.ops.wm.open_mainfile(filepath=os.path.join(main_path, relative_path))
+    map_obj = bpy.data.objects["EXPORT_GOOGLE_SAT_WM"]
+
+    entry = get_file_stamp(os.path.join(main_path, relative_path), use_hash)
+    entry.update({
+        "max_x": map_obj.dimensions.x / 2,
+        "max_y": map_obj.dimensions.y / 2
+    })
+    return entry
+
+
+def index_assets(main_path, use_hash=False):
+    """
+    Writes asset_manifest.json with the footprints and metadata of all
+    the vehicle models and the map extents of all the lands. Entries of
+    the files that did not change are kept without importing them again.
+    """
+    manifest_filepath = os.path.join(main_path, "asset_manifest.json")
+    old_manifest = load_asset_manifest(manifest_filepath)
+    manifest = {"vehicles": {}, "lands": {}}
+
+    for folder, vehicle_class in VEHICLE_FOLDERS:
+        for filename in get_asset_files(
+            os.path.join(main_path, "Vehicles", folder), ".fbx"):
+            relative_path = "/".join(("Vehicles", folder, filename))
+            entry = get_valid_entry(
+                old_manifest, "vehicles", main_path, relative_path)
+            if entry is None or (use_hash and "sha1" not in entry):
+                print("Indexing " + relative_path)
+                entry = index_vehicle(
+                    main_path, relative_path, vehicle_class, use_hash)
+            manifest["vehicles"][relative_path] = entry
+
+    for filename in get_asset_files(os.path.join(main_path, "Lands"), ".blend"):
+        relative_path = "/".join(("Lands", filename))
+        entry = get_valid_entry(old_manifest, "lands", main_path, relative_path)
+        if entry is None or (use_hash and "sha1" not in entry):
+            print("Indexing " + relative_path)
+            entry = index_land(main_path, relative_path, use_hash)
+        manifest["lands"][relative_path] = entry
+
+    save_asset_manifest(manifest, manifest_filepath)
+    print("Indexed " + str(len(manifest["vehicles"])) + " vehicles and " +
+          str(len(manifest["lands"])) + " lands")
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--main_path', dest='main_path', required=True)
+    parser.add_argument('--hash', dest='hash', action='store_true')
+    args = parser.parse_args(argv)
+
+    index_assets(args.main_path, args.hash)
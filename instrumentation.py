@@ -0,0 +1,105 @@
+import contextlib
+import functools
+import json
+import os
+import time
+
+
+# Measurements of the land that is currently being generated
+land_record = {}
+
+
+def start_land(iteration):
+    """
+    Starts collecting measurements of a new land.
+    """
+    land_record.clear()
+    land_record.update({
+        "iteration": iteration,
+        "start_time": time.time(),
+        "stages": {},
+        "counters": {}
+    })
+
+
+@contextlib.contextmanager
+def timed_stage(stage_name):
+    """
+    Measures the wall time of the code inside the with statement and
+    adds it to the given stage of the current land.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        if land_record:
+            stage = land_record["stages"].setdefault(
+                stage_name, {"time": 0.0, "calls": 0})
+            stage["time"] += time.perf_counter() - start_time
+            stage["calls"] += 1
+
+
+def timed(function):
+    """
+    Decorator that measures every call of the function
+    as a stage with the function name.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with timed_stage(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def count(counter_name, value=1):
+    """
+    Increases the counter of the current land, for example
+    the number of rejected vehicles or render calls.
+    """
+    if land_record:
+        land_record["counters"][counter_name] = (
+            land_record["counters"].get(counter_name, 0) + value)
+
+
+def get_memory_usage():
+    """
+    Returns the resident memory of the process in bytes, or None if it
+    can not be read. It is read from /proc on Linux and from psutil,
+    which is only needed on other systems.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def record_memory(data_blocks_counts):
+    """
+    Stores the resident memory and the given number of data blocks
+    of each collection in the record of the current land.
+    """
+    if land_record:
+        land_record["memory"] = {
+            "rss": get_memory_usage(),
+            "data_blocks": data_blocks_counts
+        }
+
+
+def finish_land(performance_filepath, images_count):
+    """
+    Appends the measurements of the current land as one
+    JSON line to the performance file.
+    """
+    record = dict(land_record)
+    record["wall_time"] = time.time() - record.pop("start_time")
+    record["images"] = images_count
+    with open(performance_filepath, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    land_record.clear()
+    return record
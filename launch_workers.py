@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+from merge_shards import merge_shards
+from run_manifest import RESTART_EXIT_CODE, load_run_manifest
+
+
+def split_lands(lands_count, workers_count):
+    """
+    Splits the lands between the workers as evenly as possible.
+    """
+    return [lands_count // workers_count +
+            (1 if k < lands_count % workers_count else 0)
+            for k in range(0, workers_count)]
+
+
+def wait_for_workers(workers, poll_interval=1.0):
+    """
+    Waits for all the worker processes. Workers that stopped with
+    RESTART_EXIT_CODE because they used too much memory are started
+    again and resume their run. Returns the arguments of the workers
+    that failed.
+    """
+    failed_workers = []
+    running_workers = list(workers)
+    while running_workers:
+        time.sleep(poll_interval)
+        for worker in list(running_workers):
+            return_code = worker.poll()
+            if return_code is None:
+                continue
+            running_workers.remove(worker)
+            if return_code == RESTART_EXIT_CODE:
+                worker_args = list(worker.args)
+                if "--resume" not in worker_args:
+                    worker_args.append("--resume")
+                print("Restarting worker: " + " ".join(worker_args))
+                running_workers.append(subprocess.Popen(worker_args))
+            elif return_code != 0:
+                failed_workers.append(worker.args)
+    return failed_workers
+
+
+def launch_workers(blender_path, workers_count, cars_count, cameras_count,
+                   lands_count, output_path, seed, images_per_camera=1):
+    """
+    Starts headless Blender workers that run create_synthetic_dataset.py.
+    Every worker gets its own seed, image index range and shard folder.
+    Index ranges leave room for images_per_camera images of every
+    camera, which is the number of tiles times LIGHTING_VARIANTS.
+    Waits for all the workers and returns the shard folders and
+    the elapsed time in seconds.
+    """
+    script_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "create_synthetic_dataset.py")
+
+    workers = []
+    shard_paths = []
+    first_index = 0
+    start_time = time.time()
+    for k, worker_lands_count in enumerate(split_lands(lands_count, workers_count)):
+        if worker_lands_count == 0:
+            continue
+        shard_path = os.path.join(output_path, "shard_" + str(k))
+        shard_paths.append(shard_path)
+        workers.append(subprocess.Popen([
+            blender_path, "--background", "--python", script_path, "--",
+            "--cars_count", str(cars_count),
+            "--cameras_count", str(cameras_count),
+            "--lands_count", str(worker_lands_count),
+            "--seed", str(seed + k),
+            "--dataset_path", shard_path,
+            "--first_index", str(first_index)]))
+        first_index += worker_lands_count * cameras_count * images_per_camera
+
+    failed_workers = wait_for_workers(workers)
+    for worker_args in failed_workers:
+        print("Worker failed: " + " ".join(worker_args), file=sys.stderr)
+
+    return shard_paths, time.time() - start_time
+
+
+def count_images(shard_paths):
+    """
+    Returns the number of images of the finished lands in all the
+    shards, read from their run manifests, so it does not depend on
+    the output format and skips lands that were not finished.
+    """
+    images_count = 0
+    for shard_path in shard_paths:
+        manifest = load_run_manifest(
+            os.path.join(shard_path, "run_manifest.json"))
+        if manifest is not None:
+            images_count += sum(len(land["image_indices"])
+                                for land in manifest["finished_lands"])
+    return images_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--blender', dest='blender', required=True)
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=os.cpu_count())
+    parser.add_argument('-c', '--cars_count', dest='cars_count', type=int, required=True)
+    parser.add_argument('-i', '--cameras_count', dest='cameras_count', type=int, required=True)
+    parser.add_argument('-l', '--lands_count', dest='lands_count', type=int, required=True)
+    parser.add_argument('-o', '--output', dest='output', required=True)
+    parser.add_argument('-s', '--seed', dest='seed', type=int, default=None)
+    parser.add_argument('-m', '--merge_to', dest='merge_to', default=None)
+    parser.add_argument('-t', '--images_per_camera', dest='images_per_camera', type=int, default=1)
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randint(0, 2**31)
+    shard_paths, elapsed_time = launch_workers(
+        args.blender, args.workers, args.cars_count, args.cameras_count,
+        args.lands_count, args.output, seed, args.images_per_camera)
+
+    images_count = count_images(shard_paths)
+    print("Rendered " + str(images_count) + " images in " +
+          str(round(elapsed_time, 1)) + " s (" +
+          str(round(images_count / elapsed_time, 3)) + " images/s)")
+
+    if args.merge_to is not None:
+        merged_count = merge_shards(shard_paths, args.merge_to)
+        print("Merged " + str(merged_count) + " images into " + args.merge_to)
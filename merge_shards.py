@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import shutil
+
+from annotation_sinks import (
+    add_coco_annotation, add_coco_image, create_coco_sink, flush_coco_sink,
+    get_next_annotation_id, merge_coco_parts, read_coco_parts)
+from output_writer import write_file
+from tar_shards import load_shard_index, read_shard_sample
+
+
+def read_shard_coco(shard_path):
+    """
+    Returns the coco header, images and annotations of the shard. Shards
+    that did not finish have no label.json, so their label_parts
+    are read instead.
+    """
+    label_filepath = os.path.join(shard_path, "label.json")
+    if os.path.exists(label_filepath):
+        with open(label_filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        images = data.pop("images")
+        annotations = data.pop("annotations")
+        return data, images, annotations
+
+    parts_path = os.path.join(shard_path, "label_parts")
+    return (None, list(read_coco_parts(parts_path, "image")),
+            list(read_coco_parts(parts_path, "annotation")))
+
+
+def merge_shards(shard_paths, output_path, move_files=False):
+    """
+    Merges images, yolo labels and coco annotations of all the shards into
+    one dataset. Images get new consecutive ids in shard order and
+    annotations new unique ids. Workers that wrote tar shards have their
+    images and labels read through the shard index and written as
+    files. Returns the number of merged images.
+    """
+    for folder in ("images", "labels"):
+        if not os.path.exists(os.path.join(output_path, folder)):
+            os.makedirs(os.path.join(output_path, folder))
+    transfer = shutil.move if move_files else shutil.copy2
+
+    parts_path = os.path.join(output_path, "label_parts")
+    if os.path.exists(parts_path):
+        shutil.rmtree(parts_path)
+    coco_sink = create_coco_sink(parts_path, 500)
+    coco_header = None
+    next_image_id = 0
+
+    for shard_path in shard_paths:
+        header, images, annotations = read_shard_coco(shard_path)
+        tar_shards_path = os.path.join(shard_path, "shards")
+        tar_index = None
+        if os.path.exists(os.path.join(tar_shards_path, "index.jsonl")):
+            tar_index = load_shard_index([tar_shards_path])
+        if coco_header is None:
+            coco_header = header
+
+        annotations_by_image = {}
+        for annotation in annotations:
+            annotations_by_image.setdefault(
+                annotation["image_id"], []).append(annotation)
+
+        for image in sorted(images, key=lambda image: image["id"]):
+            old_image_id = image["id"]
+            extension = os.path.splitext(image["file_name"])[1]
+            label_filepath = os.path.join(
+                output_path, "labels", str(next_image_id) + ".txt")
+            if tar_index is not None:
+                # Images of an unfinished land may be missing
+                if str(old_image_id) not in tar_index:
+                    continue
+                sample_files = read_shard_sample(
+                    tar_index[str(old_image_id)], [extension[1:], "txt"])
+                image["file_name"] = "images/" + str(next_image_id) + extension
+                write_file(os.path.join(output_path, image["file_name"]),
+                           sample_files[extension[1:]])
+                write_file(label_filepath, sample_files.get("txt", b""))
+            else:
+                image_filepath = os.path.join(shard_path, image["file_name"])
+                if not os.path.exists(image_filepath):
+                    continue
+                image["file_name"] = "images/" + str(next_image_id) + extension
+                transfer(image_filepath,
+                         os.path.join(output_path, image["file_name"]))
+                worker_label_filepath = os.path.join(
+                    shard_path, "labels", str(old_image_id) + ".txt")
+                if os.path.exists(worker_label_filepath):
+                    transfer(worker_label_filepath, label_filepath)
+            image["id"] = next_image_id
+
+            add_coco_image(coco_sink, image)
+            for annotation in annotations_by_image.get(old_image_id, []):
+                annotation["id"] = get_next_annotation_id(coco_sink)
+                annotation["image_id"] = next_image_id
+                add_coco_annotation(coco_sink, annotation)
+            next_image_id += 1
+
+    flush_coco_sink(coco_sink)
+    merge_coco_parts(
+        parts_path, os.path.join(output_path, "label.json"),
+        coco_header or {"description": {}, "licenses": [], "categories": []})
+    shutil.rmtree(parts_path)
+    return next_image_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', dest='output', required=True)
+    parser.add_argument('-m', '--move', dest='move', action='store_true')
+    parser.add_argument('shards', nargs='+')
+    args = parser.parse_args()
+
+    images_count = merge_shards(args.shards, args.output, args.move)
+    print("Merged " + str(images_count) + " images into " + args.output)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from camera_projection import unproject_points
+
+
+def get_ground_points(camera_matrix, resolution, ground_z):
+    """
+    Returns (height, width, 2) world (x, y) coordinates where the rays
+    through the pixel centers hit the ground plane at ground_z. Row 0
+    is the top row of the image.
+    """
+    width, height = resolution
+    frame_x, frame_y = np.meshgrid((np.arange(width) + 0.5) / width,
+                                   1 - (np.arange(height) + 0.5) / height)
+    near, far = unproject_points(camera_matrix, frame_x, frame_y)
+    t = (ground_z - near[..., 2]) / (far[..., 2] - near[..., 2])
+    return near[..., :2] + t[..., None] * (far[..., :2] - near[..., :2])
+
+
+def sample_texture(texture, u, v):
+    """
+    Bilinearly samples the texture (rows, columns, channels) with row 0
+    at the bottom, the same as Blender image pixels, at the given
+    u and v texture coordinates.
+    """
+    rows, columns = texture.shape[:2]
+    x = np.clip(u * columns - 0.5, 0, columns - 1)
+    y = np.clip(v * rows - 0.5, 0, rows - 1)
+    x0 = np.minimum(np.floor(x).astype(int), columns - 2)
+    y0 = np.minimum(np.floor(y).astype(int), rows - 2)
+    wx = (x - x0)[..., None]
+    wy = (y - y0)[..., None]
+
+    return ((1 - wy) * ((1 - wx) * texture[y0, x0] + wx * texture[y0, x0 + 1]) +
+            wy * ((1 - wx) * texture[y0 + 1, x0] + wx * texture[y0 + 1, x0 + 1]))
+
+
+def crop_orthophoto(texture, plane_bounds, camera_matrix, resolution,
+                    ground_z=0):
+    """
+    Returns the (height, width, channels) image of the orthophoto texture
+    as seen by the camera, with row 0 at the top. Plane bounds are the
+    world (min_x, min_y, max_x, max_y) covered by the texture.
+    """
+    ground_points = get_ground_points(camera_matrix, resolution, ground_z)
+    u = (ground_points[..., 0] - plane_bounds[0]) / (plane_bounds[2] - plane_bounds[0])
+    v = (ground_points[..., 1] - plane_bounds[1]) / (plane_bounds[3] - plane_bounds[1])
+    return sample_texture(texture, u, v)
+
+
+def get_pixel_difference(image1, image2):
+    """
+    Returns the mean and the maximum absolute difference of
+    two images with values between 0 and 1.
+    """
+    difference = np.abs(np.asarray(image1, dtype=float) -
+                        np.asarray(image2, dtype=float))
+    return float(difference.mean()), float(difference.max())
@@ -0,0 +1,131 @@
+import concurrent.futures
+import io
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+
+def create_output_writer(workers_count, max_pending):
+    """
+    Returns the output writer, a pool of threads that encode and write
+    the images and labels while the next image is rendered. At most
+    max_pending outputs wait in the pool, submitting more blocks until
+    one of them is written.
+    """
+    return {
+        "executor": concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers_count, thread_name_prefix="output_writer"),
+        "max_pending": max_pending,
+        "pending": set(),
+        # Guards the outputs that can not be written in parallel,
+        # like the tar shards
+        "lock": threading.Lock()
+    }
+
+
+def wait_for_outputs(output_writer, max_pending):
+    """
+    Waits until at most max_pending outputs are left in the pool and
+    raises the first error of the finished outputs.
+    """
+    while len(output_writer["pending"]) > max_pending:
+        done, output_writer["pending"] = concurrent.futures.wait(
+            output_writer["pending"],
+            return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            future.result()
+
+
+def submit_output(output_writer, function, *args):
+    """
+    Runs the function with the given arguments in the pool. Blocks while
+    the pool is full, so rendering can not run ahead of the disk.
+    """
+    wait_for_outputs(output_writer, output_writer["max_pending"] - 1)
+    output_writer["pending"].add(
+        output_writer["executor"].submit(function, *args))
+
+
+def flush_output_writer(output_writer):
+    """
+    Waits until all the submitted outputs are written.
+    """
+    wait_for_outputs(output_writer, 0)
+
+
+def close_output_writer(output_writer):
+    """
+    Writes all the submitted outputs and stops the threads. Outputs are
+    written even if one of them fails, the first error is raised after.
+    """
+    try:
+        flush_output_writer(output_writer)
+    finally:
+        output_writer["executor"].shutdown(wait=True)
+
+
+def linear_to_srgb(pixels):
+    """
+    Applies the sRGB transfer function to the linear color channels,
+    as the Standard view transform does when Blender saves an image.
+    """
+    color = np.clip(pixels[..., :3], 0, 1)
+    srgb = np.where(
+        color <= 0.0031308, color * 12.92,
+        1.055 * np.power(color, 1 / 2.4) - 0.055)
+    return np.concatenate((srgb, np.clip(pixels[..., 3:], 0, 1)), axis=-1)
+
+
+def encode_png(pixels, compression_level):
+    """
+    Encodes the (rows, columns, channels) 8 bit image with row 0 at the
+    top as png. zlib releases the GIL, so several images are
+    compressed in parallel.
+    """
+    rows, columns, channels = pixels.shape
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+    # Every row starts with the filter type byte, 0 is no filter
+    raw = np.zeros((rows, columns * channels + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(rows, -1)
+
+    def chunk(chunk_type, data):
+        return (struct.pack(">I", len(data)) + chunk_type + data +
+                struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack(
+                ">IIBBBBB", columns, rows, 8, color_type, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), compression_level)) +
+            chunk(b"IEND", b""))
+
+
+def encode_image(pixels, image_format, compression):
+    """
+    Encodes the linear (rows, columns, 4) float image with row 0 at the
+    bottom, as Blender stores it. Png is encoded with the given zlib
+    compression level, jpg and webp with the given quality through
+    Pillow, which is only needed for those formats.
+    """
+    image = np.round(linear_to_srgb(np.flipud(pixels)) * 255).astype(np.uint8)
+    if image_format == "png":
+        return encode_png(image, compression)
+
+    from PIL import Image
+    output = io.BytesIO()
+    Image.fromarray(image[..., :3]).save(
+        output, format="JPEG" if image_format == "jpg" else "WEBP",
+        quality=compression)
+    return output.getvalue()
+
+
+def write_file(filepath, content):
+    """
+    Writes the bytes to a temporary file first and then renames it,
+    so a crash never leaves a partially written file behind.
+    """
+    with open(filepath + ".tmp", "wb") as f:
+        f.write(content)
+    os.replace(filepath + ".tmp", filepath)
@@ -0,0 +1,74 @@
+import argparse
+import json
+
+import numpy as np
+
+
+def load_performance_records(performance_filepaths):
+    """
+    Returns the land records from all the given performance files.
+    """
+    records = []
+    for performance_filepath in performance_filepaths:
+        with open(performance_filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+
+def format_row(name, values):
+    """
+    Returns a table row with the mean and percentiles of the values.
+    """
+    percentiles = np.percentile(values, [50, 90, 99])
+    return (name.ljust(32) + str(round(float(np.mean(values)), 3)).rjust(10) +
+            "".join(str(round(float(p), 3)).rjust(10) for p in percentiles))
+
+
+def print_performance_report(records):
+    """
+    Prints per land percentiles of the stage times, call counts and
+    counters, together with the overall images per hour.
+    """
+    wall_times = [record["wall_time"] for record in records]
+    images_count = sum(record["images"] for record in records)
+    print("Lands: " + str(len(records)) + ", images: " + str(images_count) +
+          ", wall time: " + str(round(sum(wall_times), 1)) + " s")
+    print("Images per hour: " +
+          str(round(images_count / sum(wall_times) * 3600, 1)) + "\n")
+
+    header = "".rjust(32) + "mean".rjust(10) + "p50".rjust(10) + \
+        "p90".rjust(10) + "p99".rjust(10)
+    stage_names = sorted({name for record in records
+                          for name in record["stages"]})
+    print("Stage time per land [s]")
+    print(header)
+    print(format_row("land", wall_times))
+    for name in stage_names:
+        print(format_row(name, [
+            record["stages"].get(name, {"time": 0})["time"]
+            for record in records]))
+
+    print("\nStage calls per land")
+    print(header)
+    for name in stage_names:
+        print(format_row(name, [
+            record["stages"].get(name, {"calls": 0})["calls"]
+            for record in records]))
+
+    counter_names = sorted({name for record in records
+                            for name in record["counters"]})
+    print("\nCounters per land")
+    print(header)
+    for name in counter_names:
+        print(format_row(name, [
+            record["counters"].get(name, 0) for record in records]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('performance_files', nargs='+')
+    args = parser.parse_args()
+
+    print_performance_report(load_performance_records(args.performance_files))
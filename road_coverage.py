@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+
+def create_road_coverage_grid(road_sampler, max_x, max_y, cell_size):
+    """
+    Rasterizes the clipped roads of the road sampler into a grid that
+    covers the map extent. Every cell holds the meters of road inside
+    of it. Grid is indexed as [x cell, y cell].
+    """
+    shape = (max(1, math.ceil(2*max_x / cell_size)),
+             max(1, math.ceil(2*max_y / cell_size)))
+    lengths = np.hypot(
+        road_sampler["deltas"][:, 0], road_sampler["deltas"][:, 1])
+
+    # Each segment is split into pieces shorter than half of the cell
+    pieces_count = np.ceil(lengths / (cell_size / 2)).astype(int) + 1
+    segments = np.repeat(np.arange(len(lengths)), pieces_count)
+    piece_starts = np.cumsum(pieces_count) - pieces_count
+    pieces = np.arange(len(segments)) - np.repeat(piece_starts, pieces_count)
+    t = (pieces + 0.5) / pieces_count[segments]
+
+    points = (road_sampler["starts"][segments, :2] +
+              t[:, None] * road_sampler["deltas"][segments, :2])
+    cells_x = np.clip(((points[:, 0] + max_x) // cell_size).astype(int),
+                      0, shape[0] - 1)
+    cells_y = np.clip(((points[:, 1] + max_y) // cell_size).astype(int),
+                      0, shape[1] - 1)
+
+    road_lengths = np.zeros(shape)
+    np.add.at(road_lengths, (cells_x, cells_y),
+              lengths[segments] / pieces_count[segments])
+
+    return {
+        "cell_size": cell_size,
+        "max_x": max_x,
+        "max_y": max_y,
+        "road_lengths": road_lengths
+    }
+
+
+def get_camera_cells(coverage_grid, half_width, half_height, min_coverage):
+    """
+    Returns the (x cell, y cell) indices of all cells where a camera
+    with the given ground footprint half sizes can be placed anywhere
+    inside the cell. Footprint has to stay inside the map and contain
+    at least min_coverage meters of road. Only cells that are entirely
+    inside the footprint are counted, so the coverage is a lower bound.
+    """
+    cell_size = coverage_grid["cell_size"]
+    road_lengths = coverage_grid["road_lengths"]
+    window_x = math.floor(half_width / cell_size) - 1
+    window_y = math.floor(half_height / cell_size) - 1
+    if window_x < 0 or window_y < 0:
+        raise ValueError("Road coverage cells are larger than the camera view.")
+
+    # Summed area table with a leading row and column of zeros
+    summed = np.zeros((road_lengths.shape[0] + 1, road_lengths.shape[1] + 1))
+    summed[1:, 1:] = road_lengths.cumsum(axis=0).cumsum(axis=1)
+
+    cells_x = np.arange(road_lengths.shape[0])
+    cells_y = np.arange(road_lengths.shape[1])
+    low_x = np.clip(cells_x - window_x, 0, road_lengths.shape[0])
+    high_x = np.clip(cells_x + window_x + 1, 0, road_lengths.shape[0])
+    low_y = np.clip(cells_y - window_y, 0, road_lengths.shape[1])
+    high_y = np.clip(cells_y + window_y + 1, 0, road_lengths.shape[1])
+    coverage = (summed[high_x][:, high_y] - summed[low_x][:, high_y] -
+                summed[high_x][:, low_y] + summed[low_x][:, low_y])
+
+    # Whole footprint must stay inside the map for any camera
+    # position inside the cell
+    cell_low_x = cells_x * cell_size - coverage_grid["max_x"]
+    cell_low_y = cells_y * cell_size - coverage_grid["max_y"]
+    inside_x = ((cell_low_x - half_width >= -coverage_grid["max_x"]) &
+                (cell_low_x + cell_size + half_width <= coverage_grid["max_x"]))
+    inside_y = ((cell_low_y - half_height >= -coverage_grid["max_y"]) &
+                (cell_low_y + cell_size + half_height <= coverage_grid["max_y"]))
+
+    valid = (coverage >= min_coverage) & (coverage > 0)
+    valid &= inside_x[:, None] & inside_y[None, :]
+    return np.argwhere(valid)
+
+
+def sample_camera_locations(coverage_grid, camera_cells, n, height,
+                            rng=np.random):
+    """
+    Returns n random camera locations (x, y, height), each drawn
+    uniformly from the given camera cells.
+    """
+    if len(camera_cells) == 0:
+        raise ValueError("There is no camera position with enough road.")
+
+    cell_size = coverage_grid["cell_size"]
+    cells = camera_cells[rng.choice(len(camera_cells), n)]
+    x = (cells[:, 0] + rng.uniform(0, 1, n)) * cell_size - coverage_grid["max_x"]
+    y = (cells[:, 1] + rng.uniform(0, 1, n)) * cell_size - coverage_grid["max_y"]
+    return [(float(x[i]), float(y[i]), height) for i in range(0, n)]
@@ -0,0 +1,145 @@
+import numpy as np
+
+
+def get_clip_intervals(starts, ends, bounds):
+    """
+    Returns the parameters t_start and t_end (E,) of the parts of the
+    3D line segments inside the rectangle bounds (min_x, min_y, max_x,
+    max_y), computed with the Liang-Barsky algorithm, and whether
+    each segment is at least partially inside.
+    """
+    delta = ends - starts
+    t_start = np.zeros(len(starts))
+    t_end = np.ones(len(starts))
+    inside = np.ones(len(starts), dtype=bool)
+
+    for axis in (0, 1):
+        for p, q in ((-delta[:, axis], starts[:, axis] - bounds[axis]),
+                     (delta[:, axis], bounds[axis + 2] - starts[:, axis])):
+            parallel = p == 0
+            # Parallel segments outside of the boundary are dropped
+            inside &= ~(parallel & (q < 0))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.where(parallel, 0, q / np.where(parallel, 1, p))
+            t_start = np.where(~parallel & (p < 0), np.maximum(t_start, t), t_start)
+            t_end = np.where(~parallel & (p > 0), np.minimum(t_end, t), t_end)
+
+    inside &= t_start < t_end
+    return t_start, t_end, inside
+
+
+def clip_segments(starts, ends, max_x, max_y):
+    """
+    Clips 3D line segments to the map extent [-max_x, max_x] x
+    [-max_y, max_y]. Returns the clipped start and end points of
+    the segments that are at least partially inside the extent.
+    """
+    t_start, t_end, inside = get_clip_intervals(
+        starts, ends, (-max_x, -max_y, max_x, max_y))
+    delta = ends - starts
+    clipped_starts = starts + t_start[:, None] * delta
+    clipped_ends = starts + t_end[:, None] * delta
+    return clipped_starts[inside], clipped_ends[inside]
+
+
+def create_segments_sampler(starts, delta):
+    """
+    Returns the road sampler of the segments with the given start
+    points and deltas (E, 3). Segments of zero length are dropped.
+    """
+    lengths = np.hypot(delta[:, 0], delta[:, 1])
+    keep = lengths > 0
+    starts, delta, lengths = starts[keep], delta[keep], lengths[keep]
+
+    if len(lengths) == 0:
+        raise ValueError("There are no roads inside the map extent.")
+
+    return {
+        "starts": starts,
+        "deltas": delta,
+        "headings": np.arctan2(delta[:, 1], delta[:, 0]),
+        "cumulative_lengths": np.cumsum(lengths),
+        "total_length": float(np.sum(lengths))
+    }
+
+
+def create_road_sampler(vertices, edges, max_x, max_y):
+    """
+    Builds the road sampler from road mesh vertices (V, 3) and edges
+    (E, 2). Edges are clipped to the map extent and a cumulative
+    length table is stored so that points are sampled uniformly
+    per meter of road.
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+    starts, ends = clip_segments(
+        vertices[edges[:, 0]], vertices[edges[:, 1]], max_x, max_y)
+    return create_segments_sampler(starts, ends - starts)
+
+
+def crop_road_sampler(road_sampler, regions):
+    """
+    Returns the road sampler of the roads inside the union of the
+    rectangle regions (R, 4) (min_x, min_y, max_x, max_y). Every
+    region cuts one interval out of each segment, overlapping
+    intervals are merged, so roads seen by several regions are not
+    sampled more often.
+    """
+    starts = road_sampler["starts"]
+    ends = starts + road_sampler["deltas"]
+    intervals = [get_clip_intervals(starts, ends, bounds) for bounds in regions]
+    t_starts = np.stack([np.where(inside, t_start, np.inf)
+                         for t_start, _, inside in intervals], axis=1)
+    t_ends = np.stack([np.where(inside, t_end, -np.inf)
+                       for _, t_end, inside in intervals], axis=1)
+    order = np.argsort(t_starts, axis=1)
+    t_starts = np.take_along_axis(t_starts, order, axis=1)
+    t_ends = np.take_along_axis(t_ends, order, axis=1)
+
+    # Sweeps the sorted intervals of all segments at once, a merged
+    # interval is finished when the next one starts after its end
+    segments, pieces_start, pieces_end = [], [], []
+    current_start, current_end = t_starts[:, 0], t_ends[:, 0]
+    for k in range(1, len(regions) + 1):
+        if k < len(regions):
+            next_start, next_end = t_starts[:, k], t_ends[:, k]
+        else:
+            next_start = np.full(len(starts), np.inf)
+            next_end = np.full(len(starts), -np.inf)
+        finished = (next_start > current_end) & (current_start < current_end)
+        segments.append(np.flatnonzero(finished))
+        pieces_start.append(current_start[finished])
+        pieces_end.append(current_end[finished])
+
+        restart = next_start > current_end
+        current_start = np.where(restart, next_start, current_start)
+        current_end = np.where(restart, next_end,
+                               np.maximum(current_end, next_end))
+
+    segments = np.concatenate(segments)
+    pieces_start = np.concatenate(pieces_start)
+    pieces_end = np.concatenate(pieces_end)
+    deltas = road_sampler["deltas"][segments]
+    return create_segments_sampler(
+        starts[segments] + pieces_start[:, None] * deltas,
+        (pieces_end - pieces_start)[:, None] * deltas)
+
+
+def sample_road_points(road_sampler, n, rng=np.random):
+    """
+    Returns n random points on the roads (n, 3) and the
+    road heading angles at those points (n,).
+    """
+    distances = rng.uniform(0, road_sampler["total_length"], n)
+    segments = np.searchsorted(
+        road_sampler["cumulative_lengths"], distances, side="right")
+    segments = np.minimum(segments, len(road_sampler["starts"]) - 1)
+
+    segment_ends = road_sampler["cumulative_lengths"][segments]
+    segment_lengths = np.hypot(
+        road_sampler["deltas"][segments, 0], road_sampler["deltas"][segments, 1])
+    t = 1 - (segment_ends - distances) / segment_lengths
+
+    points = (road_sampler["starts"][segments] +
+              np.clip(t, 0, 1)[:, None] * road_sampler["deltas"][segments])
+    return points, road_sampler["headings"][segments]
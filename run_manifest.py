@@ -0,0 +1,109 @@
+import json
+import os
+import random
+
+import numpy as np
+
+
+# Exit code of a worker that saved its manifest and stopped because it
+# used too much memory, it continues in a new process with --resume
+RESTART_EXIT_CODE = 75
+
+def create_run_manifest():
+    """
+    Returns the manifest of a new run with no finished lands.
+    """
+    return {
+        "next_iteration": 0,
+        "next_annotation_id": 1,
+        "coco_part_index": 0,
+        "coco_part_size": 0,
+        "coco_images_in_part": 0,
+        "shard_index": 0,
+        "shard_size": 0,
+        "samples_in_shard": 0,
+        "shard_index_size": 0,
+        "random_state": None,
+        "numpy_random_state": None,
+        "land_schedule": None,
+        "finished_lands": []
+    }
+
+
+def load_run_manifest(manifest_filepath):
+    """
+    Returns the manifest saved by the previous run or
+    None if there is no manifest.
+    """
+    if not os.path.exists(manifest_filepath):
+        return None
+    with open(manifest_filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_run_manifest(manifest, manifest_filepath):
+    """
+    Saves the manifest atomically, so a crash while saving
+    keeps the previous manifest intact.
+    """
+    with open(manifest_filepath + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_filepath + ".tmp", manifest_filepath)
+
+
+def get_random_states():
+    """
+    Returns the states of python and numpy random generators
+    in a json serializable form.
+    """
+    numpy_state = np.random.get_state()
+    return (
+        list(random.getstate()),
+        [numpy_state[0], numpy_state[1].tolist()] + list(numpy_state[2:]))
+
+
+def set_random_states(manifest):
+    """
+    Restores the random generator states saved in the manifest.
+    """
+    if manifest["random_state"] is not None:
+        version, internal_state, gauss_next = manifest["random_state"]
+        random.setstate((version, tuple(internal_state), gauss_next))
+    if manifest["numpy_random_state"] is not None:
+        numpy_state = manifest["numpy_random_state"]
+        np.random.set_state((
+            numpy_state[0], np.array(numpy_state[1], dtype=np.uint32),
+            *numpy_state[2:]))
+
+
+def record_finished_land(manifest, iteration, land_file, camera_locations,
+                         image_indices, coco_sink, shard_writer=None):
+    """
+    Records the land that was fully rendered and annotated, together
+    with everything needed to continue the run after it. Shard writer
+    is given when the images are written into tar shards.
+    """
+    manifest["finished_lands"].append({
+        "iteration": iteration,
+        "land_file": land_file,
+        "camera_locations": [list(location) for location in camera_locations],
+        "image_indices": list(image_indices)
+    })
+    manifest["next_iteration"] = iteration + 1
+    manifest["next_annotation_id"] = coco_sink["next_annotation_id"]
+    manifest["coco_part_index"] = coco_sink["part_index"]
+    manifest["coco_images_in_part"] = coco_sink["images_in_part"]
+    part_filepath = os.path.join(
+        coco_sink["parts_path"],
+        "part_" + str(coco_sink["part_index"]) + ".jsonl")
+    manifest["coco_part_size"] = (
+        os.path.getsize(part_filepath) if os.path.exists(part_filepath) else 0)
+    if shard_writer is not None:
+        manifest["shard_index"] = shard_writer["shard_index"]
+        manifest["shard_size"] = shard_writer["shard_size"]
+        manifest["samples_in_shard"] = shard_writer["samples_in_shard"]
+        manifest["shard_index_size"] = shard_writer["index_size"]
+    manifest["random_state"], manifest["numpy_random_state"] = (
+        get_random_states())
@@ -0,0 +1,162 @@
+import numpy as np
+
+from road_sampler import sample_road_points
+from spatial_index import do_footprints_overlap
+
+
+def get_box_corners(positions, headings, model_bounds):
+    """
+    Returns (N, 4, 2) world space footprint corners ordered around the
+    box. Model bounds are the local (min_x, min_y, max_x, max_y) of the
+    vehicle footprint, positions are (N, 2+) and headings (N,).
+    """
+    model_bounds = np.asarray(model_bounds, dtype=float).reshape(-1, 4)
+    local_x = model_bounds[:, [0, 0, 2, 2]]
+    local_y = model_bounds[:, [1, 3, 3, 1]]
+    cos = np.cos(headings)[:, None]
+    sin = np.sin(headings)[:, None]
+    corners = np.empty((len(positions), 4, 2))
+    corners[:, :, 0] = positions[:, 0, None] + cos*local_x - sin*local_y
+    corners[:, :, 1] = positions[:, 1, None] + sin*local_x + cos*local_y
+    return corners
+
+
+def get_neighbor_pairs(centers, other_centers, cell_size):
+    """
+    Returns index arrays (rows, columns) of all pairs of points from the
+    two (N, 2) center arrays that lie in the same or neighbouring cells
+    of a uniform grid with the given cell size. Other centers are
+    sorted by their cell once and every center looks up its 3 x 3
+    neighbouring cells with a binary search.
+    """
+    low = np.minimum(centers.min(axis=0), other_centers.min(axis=0))
+    # Cells are shifted by one, so the neighbours of the first cells
+    # have non negative indices too
+    cells = np.floor((centers - low) / cell_size).astype(np.int64) + 1
+    other_cells = (np.floor((other_centers - low) / cell_size)
+                   .astype(np.int64) + 1)
+    rows_count = max(cells[:, 1].max(), other_cells[:, 1].max()) + 2
+    other_keys = other_cells[:, 0] * rows_count + other_cells[:, 1]
+    order = np.argsort(other_keys, kind="stable")
+    sorted_keys = other_keys[order]
+
+    rows, columns = [], []
+    for offset_x in (-1, 0, 1):
+        for offset_y in (-1, 0, 1):
+            keys = ((cells[:, 0] + offset_x) * rows_count +
+                    cells[:, 1] + offset_y)
+            starts = np.searchsorted(sorted_keys, keys, side="left")
+            counts = np.searchsorted(sorted_keys, keys, side="right") - starts
+            pair_rows = np.repeat(np.arange(len(centers)), counts)
+            # Position of every pair inside the run of its cell
+            runs = np.arange(len(pair_rows)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            rows.append(pair_rows)
+            columns.append(order[np.repeat(starts, counts) + runs])
+    return np.concatenate(rows), np.concatenate(columns)
+
+
+def find_overlapping_pairs(corners, other_corners, cell_size=10):
+    """
+    Returns index arrays (rows, columns) of all overlapping pairs of
+    boxes from the two (N, 4, 2) corner arrays. Only boxes whose
+    centers are in neighbouring grid cells are paired, then the pairs
+    are filtered by the distance of the circumscribed circles of the
+    boxes. Cells grow when the boxes are too large for the given size.
+    """
+    if len(corners) == 0 or len(other_corners) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    centers = corners.mean(axis=1)
+    radii = np.linalg.norm(corners - centers[:, None], axis=-1).max(axis=1)
+    other_centers = other_corners.mean(axis=1)
+    other_radii = np.linalg.norm(
+        other_corners - other_centers[:, None], axis=-1).max(axis=1)
+
+    # Overlapping boxes are never further apart than one cell
+    rows, columns = get_neighbor_pairs(
+        centers, other_centers,
+        max(cell_size, radii.max() + other_radii.max()))
+    distances = np.linalg.norm(centers[rows] - other_centers[columns], axis=-1)
+    near = distances < radii[rows] + other_radii[columns]
+    rows, columns = rows[near], columns[near]
+    overlap = do_footprints_overlap(corners[rows], other_corners[columns])
+    return rows[overlap], columns[overlap]
+
+
+def plan_vehicle_layout(road_sampler, model_bounds, count, color_weights,
+                        rng=np.random, existing_corners=None,
+                        max_attempts_factor=50, stats=None, cell_size=10,
+                        min_batch_size=64):
+    """
+    Lays out count vehicles on the roads without overlaps. Candidates
+    are drawn in batches and tested against accepted vehicles and
+    existing_corners (K, 4, 2) at once, pairing only the boxes in
+    neighbouring cells of a grid with the given cell size. Batches
+    have at least min_batch_size candidates, so the grid of accepted
+    vehicles is not rebuilt for every few candidates on full roads.
+    Returns a list of accepted (model id, position, heading, color
+    index) tuples. Fewer vehicles are returned if the roads are full
+    after max_attempts_factor * count candidates. Number of drawn and
+    rejected candidates is stored in the stats dict.
+    """
+    model_bounds = np.asarray(model_bounds, dtype=float).reshape(-1, 4)
+    color_weights = np.asarray(color_weights, dtype=float)
+    color_weights = color_weights / color_weights.sum()
+    if existing_corners is None:
+        existing_corners = np.empty((0, 4, 2))
+    accepted_corners = np.asarray(
+        existing_corners, dtype=float).reshape(-1, 4, 2)
+
+    layout = []
+    attempts = 0
+    rejected = 0
+    while len(layout) < count and attempts < max_attempts_factor * count:
+        batch_size = min(
+            max(2 * (count - len(layout)), min_batch_size),
+            max_attempts_factor * count - attempts)
+        attempts += batch_size
+
+        model_ids = rng.choice(len(model_bounds), batch_size)
+        positions, headings = sample_road_points(road_sampler, batch_size, rng)
+        # Vehicles drive in both directions of the road
+        headings = headings + np.pi * rng.choice(2, batch_size)
+        corners = get_box_corners(positions, headings, model_bounds[model_ids])
+
+        free = np.ones(batch_size, dtype=bool)
+        free[find_overlapping_pairs(
+            corners, accepted_corners, cell_size)[0]] = False
+        candidates = np.nonzero(free)[0]
+        rejected += batch_size - len(candidates)
+
+        # Candidates of the same batch can still overlap each other,
+        # so they are accepted greedily in the order they were drawn
+        rows, columns = find_overlapping_pairs(
+            corners[candidates], corners[candidates], cell_size)
+        earlier_overlaps = [[] for _ in candidates]
+        for row, column in zip(rows[columns < rows], columns[columns < rows]):
+            earlier_overlaps[row].append(column)
+
+        kept = []
+        is_kept = np.zeros(len(candidates), dtype=bool)
+        for k in range(0, len(candidates)):
+            if len(layout) + len(kept) == count:
+                break
+            if not is_kept[earlier_overlaps[k]].any():
+                is_kept[k] = True
+                kept.append(candidates[k])
+            else:
+                rejected += 1
+        kept = np.array(kept, dtype=int)
+
+        color_ids = rng.choice(len(color_weights), len(kept), p=color_weights)
+        for i, color_id in zip(kept, color_ids):
+            layout.append((
+                int(model_ids[i]), tuple(float(c) for c in positions[i]),
+                float(headings[i]), int(color_id)))
+        accepted_corners = np.concatenate((accepted_corners, corners[kept]))
+
+    if stats is not None:
+        stats["candidates"] = attempts
+        stats["rejected"] = rejected
+    return layout
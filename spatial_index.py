@@ -0,0 +1,78 @@
+import math
+
+import numpy as np
+
+
+def create_spatial_index(cell_size):
+    """
+    Returns an empty uniform grid index of 2D vehicle footprints.
+    Footprints are lists of four (x, y) world coordinates ordered
+    around the rectangle.
+    """
+    return {
+        "cell_size": cell_size,
+        "cells": {},
+        "footprints": []
+    }
+
+
+def get_footprint_cells(index, footprint):
+    """
+    Returns the grid cells covered by the axis aligned
+    bounding box of the given footprint.
+    """
+    cell_size = index["cell_size"]
+    min_i = math.floor(min(p[0] for p in footprint) / cell_size)
+    max_i = math.floor(max(p[0] for p in footprint) / cell_size)
+    min_j = math.floor(min(p[1] for p in footprint) / cell_size)
+    max_j = math.floor(max(p[1] for p in footprint) / cell_size)
+    return [(i, j) for i in range(min_i, max_i + 1)
+            for j in range(min_j, max_j + 1)]
+
+
+def add_footprint(index, footprint):
+    """
+    Stores the footprint in the index and returns its id.
+    """
+    footprint_id = len(index["footprints"])
+    index["footprints"].append([tuple(p) for p in footprint])
+    for cell in get_footprint_cells(index, footprint):
+        index["cells"].setdefault(cell, []).append(footprint_id)
+    return footprint_id
+
+
+def footprint_collides(index, footprint):
+    """
+    Returns True if the footprint overlaps any footprint stored in the
+    index. Only footprints that share a grid cell with it are tested,
+    all of them at once.
+    """
+    nearby = set()
+    for cell in get_footprint_cells(index, footprint):
+        nearby.update(index["cells"].get(cell, []))
+    if not nearby:
+        return False
+    return bool(do_footprints_overlap(
+        np.array(footprint, dtype=float),
+        np.array([index["footprints"][k] for k in nearby], dtype=float)).any())
+
+
+def do_footprints_overlap(corners1, corners2):
+    """
+    Vectorized separating axis test of rectangular footprints. Takes
+    two broadcastable (..., 4, 2) corner arrays and returns a boolean
+    array telling which pairs overlap. Footprints that only touch do
+    not overlap.
+    """
+    corners1, corners2 = np.broadcast_arrays(corners1, corners2)
+    # Two edge directions of each rectangle are enough
+    edges = np.concatenate((
+        corners1[..., 1:3, :] - corners1[..., 0:2, :],
+        corners2[..., 1:3, :] - corners2[..., 0:2, :]), axis=-2)
+    axes = np.stack((edges[..., 1], -edges[..., 0]), axis=-2)
+
+    projection1 = corners1 @ axes
+    projection2 = corners2 @ axes
+    separated = ((projection1.max(axis=-2) <= projection2.min(axis=-2)) |
+                 (projection2.max(axis=-2) <= projection1.min(axis=-2)))
+    return ~separated.any(axis=-1)
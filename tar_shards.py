@@ -0,0 +1,185 @@
+import argparse
+import glob
+import io
+import json
+import os
+import tarfile
+
+
+def get_shard_filepath(shards_path, shard_index):
+    """
+    Returns the filepath of the tar shard with the given index.
+    """
+    return os.path.join(shards_path, "shard_" + str(shard_index).zfill(6) + ".tar")
+
+
+def create_shard_writer(shards_path, samples_per_shard, shard_index=0,
+                        shard_size=0, samples_in_shard=0, index_size=0):
+    """
+    Returns the writer that stores samples in fixed-size tar shards in
+    the WebDataset layout, where all the files of one sample share the
+    sample key and differ only in their extension. Every sample is also
+    recorded in index.jsonl with the offsets of its files, so samples
+    can be read without scanning the shards. Shard index, shard size,
+    samples in shard and index size are given when a previous run
+    is continued, everything written after them is removed.
+    """
+    if not os.path.exists(shards_path):
+        os.makedirs(shards_path)
+    shard_writer = {
+        "shards_path": shards_path,
+        "samples_per_shard": samples_per_shard,
+        "shard_index": shard_index,
+        "shard_size": shard_size,
+        "samples_in_shard": samples_in_shard,
+        "index_size": index_size
+    }
+    truncate_shards(shard_writer)
+    return shard_writer
+
+
+def truncate_shards(shard_writer):
+    """
+    Removes the shards and index lines written after the position
+    of the writer, which are left by work that was not finished
+    before a crash.
+    """
+    shards_path = shard_writer["shards_path"]
+    for shard_filepath in glob.glob(os.path.join(shards_path, "shard_*.tar")):
+        index = int(os.path.basename(shard_filepath)[6:-4])
+        if index > shard_writer["shard_index"]:
+            os.remove(shard_filepath)
+    shard_filepath = get_shard_filepath(shards_path, shard_writer["shard_index"])
+    if os.path.exists(shard_filepath):
+        with open(shard_filepath, "r+b") as f:
+            f.truncate(shard_writer["shard_size"])
+
+    index_filepath = os.path.join(shards_path, "index.jsonl")
+    if os.path.exists(index_filepath):
+        with open(index_filepath, "r+b") as f:
+            f.truncate(shard_writer["index_size"])
+
+
+def add_shard_sample(shard_writer, sample_key, sample_files):
+    """
+    Appends one sample to the current shard. Sample files are given as
+    a dictionary from the extension, for example "png", "txt" or
+    "json", to the file content in bytes. The shard is closed after
+    every sample, so it is always a valid tar file on disk.
+    """
+    if shard_writer["samples_in_shard"] == shard_writer["samples_per_shard"]:
+        shard_writer["shard_index"] += 1
+        shard_writer["shard_size"] = 0
+        shard_writer["samples_in_shard"] = 0
+
+    shard_filepath = get_shard_filepath(
+        shard_writer["shards_path"], shard_writer["shard_index"])
+    index_entry = {
+        "key": str(sample_key),
+        "shard": os.path.basename(shard_filepath),
+        "files": {}
+    }
+    with open(shard_filepath,
+              "r+b" if os.path.exists(shard_filepath) else "wb") as f:
+        # End of archive blocks of the previous sample are overwritten
+        f.truncate(shard_writer["shard_size"])
+        f.seek(shard_writer["shard_size"])
+        with tarfile.open(fileobj=f, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+            for extension, content in sample_files.items():
+                member = tarfile.TarInfo(str(sample_key) + "." + extension)
+                member.size = len(content)
+                tar.addfile(member, io.BytesIO(content))
+                index_entry["files"][extension] = [
+                    tar.offset - tarfile.BLOCKSIZE *
+                    ((len(content) + tarfile.BLOCKSIZE - 1) //
+                     tarfile.BLOCKSIZE), len(content)]
+            shard_writer["shard_size"] = tar.offset
+        f.flush()
+        os.fsync(f.fileno())
+
+    index_filepath = os.path.join(shard_writer["shards_path"], "index.jsonl")
+    with open(index_filepath, "a", encoding="utf-8") as f:
+        f.write(json.dumps(index_entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    shard_writer["index_size"] = os.path.getsize(index_filepath)
+    shard_writer["samples_in_shard"] += 1
+
+
+def load_shard_index(shards_paths):
+    """
+    Returns the index entries of all the samples in the given shard
+    folders as a dictionary keyed by the sample key. A partially
+    written last line left by a crash is skipped.
+    """
+    shard_index = {}
+    for shards_path in shards_paths:
+        with open(os.path.join(shards_path, "index.jsonl"), "r",
+                  encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entry["shard"] = os.path.join(shards_path, entry["shard"])
+                shard_index[entry["key"]] = entry
+    return shard_index
+
+
+def read_shard_sample(index_entry, extensions=None):
+    """
+    Returns the files of one sample as a dictionary from the extension
+    to the file content in bytes, reading only the given extensions
+    if they are given.
+    """
+    sample_files = {}
+    with open(index_entry["shard"], "rb") as f:
+        for extension, (offset, size) in index_entry["files"].items():
+            if extensions is not None and extension not in extensions:
+                continue
+            f.seek(offset)
+            sample_files[extension] = f.read(size)
+    return sample_files
+
+
+def iterate_shard_samples(shards_paths):
+    """
+    Yields the key and the files of every sample by reading the shards
+    sequentially, which is the fastest way to go through all of them.
+    """
+    for shards_path in shards_paths:
+        for shard_filepath in sorted(
+            glob.glob(os.path.join(shards_path, "shard_*.tar"))):
+            sample_key = None
+            sample_files = {}
+            with tarfile.open(shard_filepath, mode="r") as tar:
+                for member in tar:
+                    key, extension = member.name.rsplit(".", 1)
+                    if key != sample_key and sample_files:
+                        yield sample_key, sample_files
+                        sample_files = {}
+                    sample_key = key
+                    sample_files[extension] = tar.extractfile(member).read()
+            if sample_files:
+                yield sample_key, sample_files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--extract', dest='extract', default=None)
+    parser.add_argument('-o', '--output', dest='output', default=".")
+    parser.add_argument('shards', nargs='+')
+    args = parser.parse_args()
+
+    if args.extract is None:
+        samples_count = sum(1 for _ in iterate_shard_samples(args.shards))
+        print(str(samples_count) + " samples in " + str(len(args.shards)) +
+              " shard folders")
+    else:
+        sample_files = read_shard_sample(
+            load_shard_index(args.shards)[args.extract])
+        for extension, content in sample_files.items():
+            with open(os.path.join(
+                args.output, args.extract + "." + extension), "wb") as f:
+                f.write(content)
+        print("Extracted " + ", ".join(sample_files) + " of " + args.extract)
@@ -0,0 +1,179 @@
+import os
+
+import bpy
+
+
+# Imported vehicle models of the current land, keyed by the model filepath.
+# Every value is a (template object, original object name) tuple.
+vehicle_templates = {}
+cache_stats = {"hits": 0, "misses": 0, "library_loads": 0, "fbx_imports": 0}
+# Baked vehicle library written by bake_vehicle_library.py
+vehicle_library = {"filepath": None, "link": False, "object_names": set()}
+
+
+def clear_vehicle_cache():
+    """
+    Forgets all imported vehicle templates. Must be called every time
+    a new blend file is opened because opening it frees all data blocks.
+    """
+    vehicle_templates.clear()
+    for stat_name in cache_stats:
+        cache_stats[stat_name] = 0
+
+
+def get_library_object_name(model_filepath):
+    """
+    Returns the name of the model object in the baked vehicle library,
+    for example "Template:Cars/Car1.fbx".
+    """
+    return "Template:" + "/".join((
+        os.path.basename(os.path.dirname(model_filepath)),
+        os.path.basename(model_filepath)))
+
+
+def set_vehicle_library(library_filepath, link=False):
+    """
+    Makes the vehicle models load from the baked library instead of the
+    fbx files. Models are appended, or linked if link is True. Nothing
+    changes if the library does not exist.
+    """
+    vehicle_library["filepath"] = None
+    vehicle_library["object_names"] = set()
+    if not os.path.exists(library_filepath):
+        print("Vehicle library " + library_filepath +
+              " not found, models are imported from fbx files\n")
+        return
+    with bpy.data.libraries.load(library_filepath) as (data_from, data_to):
+        vehicle_library["object_names"] = set(data_from.objects)
+    vehicle_library["filepath"] = library_filepath
+    vehicle_library["link"] = link
+
+
+def is_in_vehicle_library(model_filepath):
+    """
+    Returns True if the model is baked in the library and the fbx file
+    did not change since the library was written.
+    """
+    return (vehicle_library["filepath"] is not None and
+            get_library_object_name(model_filepath) in
+            vehicle_library["object_names"] and
+            (not os.path.exists(model_filepath) or
+             os.path.getmtime(model_filepath) <=
+             os.path.getmtime(vehicle_library["filepath"])))
+
+
+def load_library_vehicle(model_filepath):
+    """
+    Appends or links the baked model object from the vehicle library
+    and returns it with its original name. Appended models get a fake
+    user like the imported ones, so purging orphan data keeps them.
+    """
+    object_name = get_library_object_name(model_filepath)
+    with bpy.data.libraries.load(
+        vehicle_library["filepath"],
+        link=vehicle_library["link"]) as (data_from, data_to):
+        data_to.objects = [object_name]
+    template_obj = data_to.objects[0]
+    # Linked data blocks cannot be edited, purge_orphan_data keeps them
+    if not vehicle_library["link"]:
+        template_obj.use_fake_user = True
+    return template_obj, template_obj.get("original_name", object_name)
+
+
+def import_fbx_vehicle(model_filepath):
+    """
+    Imports the model from the fbx file and returns it with its original
+    name. Model is kept out of the scene so it is never rendered and
+    renamed so it is not picked up as a "Car" or "Tractor" object.
+    """
+    bpy.ops.import_scene.fbx(filepath = model_filepath)
+    template_obj = bpy.context.selected_objects[0]
+    original_name = template_obj.name
+
+    for collection in list(template_obj.users_collection):
+        collection.objects.unlink(template_obj)
+    template_obj.name = "Template:" + original_name
+    template_obj.use_fake_user = True
+    return template_obj, original_name
+
+
+def get_vehicle_template(model_filepath):
+    """
+    Returns the template object of the given vehicle model and its
+    original name. Model is imported from the fbx file only the first
+    time it is requested in the current land session, from the baked
+    vehicle library if the model is in it, otherwise from the fbx file.
+    """
+    if model_filepath in vehicle_templates:
+        cache_stats["hits"] += 1
+        return vehicle_templates[model_filepath]
+
+    cache_stats["misses"] += 1
+    if is_in_vehicle_library(model_filepath):
+        cache_stats["library_loads"] += 1
+        vehicle_templates[model_filepath] = load_library_vehicle(
+            model_filepath)
+    else:
+        cache_stats["fbx_imports"] += 1
+        vehicle_templates[model_filepath] = import_fbx_vehicle(model_filepath)
+    return vehicle_templates[model_filepath]
+
+
+def get_template_footprint(template_obj):
+    """
+    Returns the local footprint bounds (min_x, min_y, max_x, max_y) of
+    the model, scaled the same way as the placed vehicles are.
+    """
+    corners_x = [corner[0] * template_obj.scale[0]
+                 for corner in template_obj.bound_box]
+    corners_y = [corner[1] * template_obj.scale[1]
+                 for corner in template_obj.bound_box]
+    return min(corners_x), min(corners_y), max(corners_x), max(corners_y)
+
+
+def add_vehicle_instance(model_filepath, copy_material=True,
+                         vehicle_name=None):
+    """
+    Adds a new vehicle object to the scene. The object shares mesh data
+    with the model template. If copy_material is True, the object gets
+    its own copy of the first material so it can be recolored. Object
+    is named vehicle_name, or as in the fbx file if it is not given.
+    """
+    template_obj, original_name = get_vehicle_template(model_filepath)
+
+    vehicle_obj = template_obj.copy()
+    vehicle_obj.name = vehicle_name or original_name
+    vehicle_obj.use_fake_user = False
+    bpy.context.scene.collection.objects.link(vehicle_obj)
+
+    if copy_material and len(vehicle_obj.material_slots) > 0:
+        material = vehicle_obj.material_slots[0].material
+        vehicle_obj.material_slots[0].link = "OBJECT"
+        vehicle_obj.material_slots[0].material = material.copy()
+
+    return vehicle_obj
+
+
+def remove_vehicle_instance(vehicle_obj):
+    """
+    Removes the vehicle object from the scene together with
+    its own copy of the material.
+    """
+    own_material = None
+    if (len(vehicle_obj.material_slots) > 0 and
+        vehicle_obj.material_slots[0].link == "OBJECT"):
+        own_material = vehicle_obj.material_slots[0].material
+
+    bpy.data.objects.remove(vehicle_obj, do_unlink=True)
+    if own_material is not None and own_material.users == 0:
+        bpy.data.materials.remove(own_material)
+
+
+def print_cache_stats():
+    """
+    Prints vehicle model cache hit and miss counts.
+    """
+    print("Vehicle model cache: " + str(cache_stats["hits"]) + " hits, " +
+          str(cache_stats["misses"]) + " misses, " +
+          str(cache_stats["library_loads"]) + " models loaded from library, " +
+          str(cache_stats["fbx_imports"]) + " imported from fbx\n")
@@ -0,0 +1,102 @@
+import numpy as np
+
+from camera_projection import project_points, unproject_points
+
+
+def get_projected_extents(vehicle_boxes, camera_matrix):
+    """
+    Returns the (N, 4) camera frame boxes (min_x, min_y, max_x, max_y)
+    of the vehicle boxes (N, 4, 3), not clamped to the image.
+    """
+    co_2d = project_points(
+        np.asarray(vehicle_boxes, dtype=float).reshape(-1, 4, 3), camera_matrix)
+    return np.concatenate((co_2d.min(axis=1), co_2d.max(axis=1)), axis=-1)
+
+
+def get_sample_rays(extents, camera_matrix, samples_per_axis):
+    """
+    Returns the origins (N, S, 3) and directions (N, S, 3) of the rays
+    through a grid of S = samples_per_axis**2 points over every camera
+    frame box (N, 4), together with a (N, S) array that tells which
+    samples are inside the image.
+    """
+    offsets = (np.arange(samples_per_axis) + 0.5) / samples_per_axis
+    offsets_x, offsets_y = [o.ravel() for o in np.meshgrid(offsets, offsets)]
+    frame_x = extents[:, 0, None] + offsets_x * (extents[:, 2] - extents[:, 0])[:, None]
+    frame_y = extents[:, 1, None] + offsets_y * (extents[:, 3] - extents[:, 1])[:, None]
+    in_frame = (frame_x >= 0) & (frame_x <= 1) & (frame_y >= 0) & (frame_y <= 1)
+
+    near, far = unproject_points(camera_matrix, frame_x, frame_y)
+    return near, far - near, in_frame
+
+
+def find_hit_vehicles(ray_cast, origins, directions, polygon_vehicle_ids,
+                      vehicle_ids, max_hits=4):
+    """
+    Casts the rays (M, 3) against the BVH of all vehicles and returns
+    two (M,) arrays: the vehicle hit first, -1 if none, and whether the
+    ray reaches the given vehicle of the ray at all. ray_cast is the
+    ray_cast method of the BVH, polygon_vehicle_ids maps its polygon
+    indices to vehicle ids. Rays continue behind the vehicles they hit,
+    at most max_hits times.
+    """
+    first_hits = np.full(len(origins), -1, dtype=int)
+    reaches_vehicle = np.zeros(len(origins), dtype=bool)
+    directions = directions / np.linalg.norm(directions, axis=-1)[:, None]
+    # Plain lists are passed to the BVH much faster than numpy rows
+    origins_list = origins.tolist()
+    directions_list = directions.tolist()
+
+    for k in range(0, len(origins)):
+        origin = origins_list[k]
+        for hit in range(0, max_hits):
+            location, _, polygon_index, _ = ray_cast(origin, directions_list[k])
+            if location is None:
+                break
+            hit_vehicle = polygon_vehicle_ids[polygon_index]
+            if hit == 0:
+                first_hits[k] = hit_vehicle
+            if hit_vehicle == vehicle_ids[k]:
+                reaches_vehicle[k] = True
+                break
+            # Continue just behind the hit surface
+            origin = (np.array(location[:]) + directions[k] * 1e-3).tolist()
+    return first_hits, reaches_vehicle
+
+
+def compute_visibility(vehicle_boxes, vehicle_ids, camera_matrix, ray_cast,
+                       polygon_vehicle_ids, samples_per_axis=4):
+    """
+    Returns the visible and truncated fractions of the given vehicles
+    (N,) seen by the camera. Every vehicle is sampled by a grid of rays
+    over its projected box, so the cost depends on the number of
+    vehicles and not on the number of pixels. Samples that reach the
+    vehicle make its silhouette. Visible samples are the ones inside
+    the image that hit the vehicle first, truncated samples are the
+    ones outside the image.
+    """
+    if len(vehicle_ids) == 0:
+        return np.empty(0), np.empty(0)
+
+    origins, directions, in_frame = get_sample_rays(
+        get_projected_extents(vehicle_boxes, camera_matrix), camera_matrix,
+        samples_per_axis)
+    samples_count = in_frame.shape[1]
+    ray_vehicle_ids = np.repeat(vehicle_ids, samples_count)
+    first_hits, reaches_vehicle = find_hit_vehicles(
+        ray_cast, origins.reshape(-1, 3), directions.reshape(-1, 3),
+        polygon_vehicle_ids, ray_vehicle_ids)
+
+    silhouette = reaches_vehicle.reshape(-1, samples_count)
+    visible = (silhouette & in_frame &
+               (first_hits == ray_vehicle_ids).reshape(-1, samples_count))
+    truncated = silhouette & ~in_frame
+    silhouette_count = np.maximum(silhouette.sum(axis=1), 1)
+    visible_fractions = visible.sum(axis=1) / silhouette_count
+    truncated_fractions = truncated.sum(axis=1) / silhouette_count
+
+    # Vehicles too small to be hit by any ray are judged by their box
+    missed = ~silhouette.any(axis=1)
+    visible_fractions[missed] = in_frame[missed].mean(axis=1)
+    truncated_fractions[missed] = 1 - visible_fractions[missed]
+    return visible_fractions, truncated_fractions